@@ -1,32 +1,92 @@
 """
     This script is an external function that add employees to the local database.
     It need to be run seperately
-    command: python add_emp_external.py
+    command: python add_emp_external.py [--file app/characters.json] [--batch-size 500]
+
+    The characters file is read incrementally, one character at a time, so large HR exports are never fully loaded.
+    Characters are sent in batches to POST /emp/bulk over a single keep-alive connection.
 """
+import argparse
 import json
+
 import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = "http://127.0.0.1:8000/emp/bulk"
+READ_SIZE = 64 * 1024
 
 
-def add_characters_to_db(file_name):
+# yields the objects of the top-level "characters" array without loading the whole file
+def iter_characters(file_name, read_size=READ_SIZE):
+    decoder = json.JSONDecoder()
     with open(file_name, 'r') as file:
-        data = json.load(file)
+        buffer = ""
+        position = -1
+        # find the opening bracket of the characters array
+        while position < 0:
+            chunk = file.read(read_size)
+            if not chunk:
+                return
+            buffer += chunk
+            key = buffer.find('"characters"')
+            if key >= 0:
+                position = buffer.find('[', key)
+        position += 1
 
-    api_url = " http://127.0.0.1:8000/emp"
+        while True:
+            # skip separators between objects
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                character, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                chunk = file.read(read_size)
+                if not chunk:
+                    raise
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield character
 
-    characters = data.get("characters", [])
 
-    for character in characters:
-        character_name = character.get("characterName")
-        if character_name:
-            request_data = {'name': character_name}
+def iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-            response = requests.post(api_url, json=request_data)
+
+def add_characters_to_db(file_name, api_url=API_URL, batch_size=500):
+    employees = ({'name': character["characterName"]} for character in iter_characters(file_name)
+                 if character.get("characterName"))
+
+    added = 0
+    with requests.Session() as session:
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        for batch in iter_batches(employees, batch_size):
+            response = session.post(api_url, json={'employees': batch})
 
             if response.status_code == 201:
-                print(f"Successfully added {character_name} to the database.")
+                added += len(batch)
+                print(f"Successfully added {added} employees to the database.")
             else:
                 print(
-                    f"Failed to add {character_name} to the database. Status code: {response.status_code}, Message: {response.text}")
+                    f"Failed to add a batch of {len(batch)} employees to the database. "
+                    f"Status code: {response.status_code}, Message: {response.text}")
+    return added
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the characters of a JSON file as employees.")
+    parser.add_argument("--file", default="app/characters.json", help="JSON file with a characters array")
+    parser.add_argument("--url", default=API_URL, help="bulk employee endpoint")
+    parser.add_argument("--batch-size", type=int, default=500, help="employees sent per request")
+    args = parser.parse_args()
 
-add_characters_to_db('app/characters.json')
+    add_characters_to_db(args.file, args.url, args.batch_size)
@@ -0,0 +1,136 @@
+"""
+    Admission control keeping gate checks responsive while admins run heavy requests on the same worker.
+    GET lists and exports, the plate snapshot and bulk imports take one of ADMIN_CONCURRENCY slots. A heavy request
+    that finds them all taken waits up to ADMISSION_TIMEOUT seconds for one, then gets a 503 with a Retry-After header.
+    Every other request, the gate checks (/car/is_registered, /ws/gate) first of all, is admitted at once and never
+    waits behind the heavy ones.
+
+    Configured through environment variables:
+    -   ADMIN_CONCURRENCY - heavy requests run at once per worker, 0 disables admission control (default 4)
+    -   ADMISSION_TIMEOUT - seconds a heavy request waits for a slot (default 1)
+"""
+import asyncio
+import os
+from collections import deque
+
+import orjson
+
+ADMIN_CONCURRENCY = int(os.getenv("ADMIN_CONCURRENCY", "4"))
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", "1"))
+RETRY_AFTER = "1"
+
+# routes, path without trailing slash by method, of the lists, exports and bulk imports
+# single-row writes and the gate checks are never heavy
+HEAVY_ROUTES = {
+    "GET": {"/car", "/car/snapshot", "/car/register", "/car/register/export", "/emp", "/emp/search"},
+    "POST": {"/car/bulk", "/emp/bulk"},
+    "PUT": {"/car/register/bulk"},
+}
+# GET /car/{car_make} lists the cars of a make, these siblings are small reads answered from memory
+CAR_LOOKUPS = {"/car/catalog"}
+
+
+def is_heavy(scope):
+    if scope["type"] != "http":
+        return False
+    method = "GET" if scope["method"] == "HEAD" else scope["method"]
+    path = scope["path"].rstrip("/")
+    if path in HEAVY_ROUTES.get(method, ()):
+        return True
+    return method == "GET" and path.count("/") == 2 and path.startswith("/car/") and path not in CAR_LOOKUPS
+
+
+class AdmissionController:
+    """
+        Bounded slots for heavy requests, handed over in arrival order to the requests waiting for one.
+    """
+
+    def __init__(self, limit=ADMIN_CONCURRENCY, timeout=ADMISSION_TIMEOUT):
+        self.limit = limit
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    # True once the request holds a slot, False when none was freed within the timeout
+    async def acquire(self):
+        if self.limit <= 0 or (self.active < self.limit and not self._waiters):
+            self.active += 1
+            self.admitted += 1
+            return True
+        if self.timeout <= 0:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            # release() may hand the slot over in the loop iteration the timeout fires, the request then holds it
+            if not self._handed_over(waiter):
+                self.rejected += 1
+                return False
+        except asyncio.CancelledError:
+            # a slot handed over to a cancelled request goes to the next one
+            if self._handed_over(waiter):
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+        return True
+
+    @staticmethod
+    def _handed_over(waiter):
+        return waiter.done() and not waiter.cancelled()
+
+    # hands the slot over to the first request still waiting, or frees it
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def clear(self):
+        self.active = 0
+        self._waiters.clear()
+        self.admitted = 0
+        self.rejected = 0
+
+    def stats(self):
+        return {"limit": self.limit, "active": self.active, "waiting": len(self._waiters),
+                "admitted": self.admitted, "rejected": self.rejected}
+
+
+admission = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """
+        ASGI middleware running heavy requests under the admission controller, and the others straight away.
+    """
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if not is_heavy(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.controller.acquire():
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"), (b"retry-after", RETRY_AFTER.encode())]})
+            await send({"type": "http.response.body", "body": orjson.dumps({"detail": "Server busy, retry later."})})
+            return
+        try:
+            # the slot is held until the last chunk of a streamed response is sent
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
@@ -0,0 +1,64 @@
+"""
+    Catalog of the car makes and models in use, with the number of cars of each.
+    Computed by one grouped query and cached in memory until a car is added, updated or deleted.
+    Makes are grouped on cars.make_key, so "Toyota" and "TOYOTA" are one make, as for the make search.
+"""
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Cars
+
+
+class CatalogCache:
+    """
+        Last computed catalog, dropped by invalidate() on every car write.
+    """
+
+    def __init__(self):
+        self._catalog = None
+        # bumped by invalidate(), a catalog computed across a write is not kept
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, db: AsyncSession):
+        if self._catalog is not None:
+            self.hits += 1
+            return self._catalog
+
+        self.misses += 1
+        version = self._version
+        catalog = await load_catalog(db)
+        if version == self._version:
+            self._catalog = catalog
+        return catalog
+
+    def invalidate(self):
+        self._version += 1
+        self._catalog = None
+
+    def clear(self):
+        self.invalidate()
+        self.hits = 0
+        self.misses = 0
+
+
+# [{"make": ..., "count": ..., "models": [{"model": ..., "count": ...}]}] ordered by make and model
+# makes are grouped case-insensitively like the make search, under their first spelling in sort order
+async def load_catalog(db: AsyncSession):
+    rows = (await db.execute(select(Cars.make_key, func.min(Cars.make), Cars.model, func.count(Cars.id))
+                             .group_by(Cars.make_key, Cars.model).order_by(Cars.make_key, Cars.model))).all()
+    catalog = []
+    make_key = None
+    for key, make, model, count in rows:
+        if not catalog or key != make_key:
+            make_key = key
+            catalog.append({"make": make, "count": 0, "models": []})
+        elif make is not None and make < catalog[-1]["make"]:
+            catalog[-1]["make"] = make
+        catalog[-1]["count"] += count
+        catalog[-1]["models"].append({"model": model, "count": count})
+    return catalog
+
+
+catalog_cache = CatalogCache()
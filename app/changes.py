@@ -0,0 +1,123 @@
+"""
+    Keeps the in-memory caches of a worker in step with the writes made by the other workers sharing the database.
+    A background task started by the app lifespan polls every SYNC_INTERVAL seconds:
+    -   plate_changes - plates registered or unregistered since the last poll are dropped from the plate index and
+        the decision cache, their next gate check reads them from the DB
+    -   table_writes - the write counter of every versioned table, a table written since the last poll gets a new
+        ETag (see app/versions.py), and the car catalog is computed again after a car write
+    -   parking_events - the allowed entries and exits recorded by the other workers are applied to the occupancy
+        (see app/occupancy.py), so every worker counts the cars let in by all of them against PARKING_CAPACITY
+    Writes of this worker are applied at once by its write endpoints, writes of another worker within SYNC_INTERVAL,
+    its gate events within EVENT_FLUSH_INTERVAL + SYNC_INTERVAL.
+
+    Configured through environment variables:
+    -   SYNC_INTERVAL - seconds between two polls, 0 disables them when a single worker serves the database
+        (default 1)
+"""
+import asyncio
+import os
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .catalog import catalog_cache
+from .events import WORKER_ID, ENTRY
+from .gate import plate_removed
+from .models import ParkingEvents, PlateChanges, TableWrites
+from .occupancy import occupancy
+from .versions import table_versions, CARS
+
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL", "1"))
+
+
+class ChangeFollower:
+    """
+        Last plate change, gate event and table write counters seen, with the background task polling for newer ones.
+    """
+
+    def __init__(self, interval=SYNC_INTERVAL):
+        self.interval = interval
+        self.plate_version = 0
+        self.event_version = 0
+        self._writes = {}
+        self._task = None
+        self.loaded = False
+        self.polls = 0
+        self.plates = 0
+        self.failed = 0
+
+    # marks every change already in the DB as seen, call it before the caches are loaded
+    async def load(self, db: AsyncSession):
+        self.plate_version = await db.scalar(select(func.coalesce(func.max(PlateChanges.id), 0)))
+        self.event_version = await db.scalar(select(func.coalesce(func.max(ParkingEvents.id), 0)))
+        self._writes = dict((await db.execute(select(TableWrites.name, TableWrites.version))).all())
+        self.loaded = True
+
+    # applies the changes written since the last poll, by this worker or another one
+    async def poll(self, db: AsyncSession):
+        rows = (await db.execute(select(PlateChanges.id, PlateChanges.plate_key)
+                                 .filter(PlateChanges.id > self.plate_version).order_by(PlateChanges.id))).all()
+        for _, plate_key in rows:
+            plate_removed(plate_key)
+        if rows:
+            self.plate_version = rows[-1].id
+            self.plates += len(rows)
+
+        events = (await db.execute(select(ParkingEvents.id, ParkingEvents.worker, ParkingEvents.allowed,
+                                          ParkingEvents.plate_key, ParkingEvents.number_plate,
+                                          ParkingEvents.direction)
+                                   .filter(ParkingEvents.id > self.event_version).order_by(ParkingEvents.id))).all()
+        for _, worker, allowed, plate_key, number_plate, direction in events:
+            # the gate of this worker already counted its own events
+            if worker == WORKER_ID or not allowed or plate_key is None:
+                continue
+            if direction == ENTRY:
+                occupancy.arrived(plate_key, number_plate)
+            else:
+                occupancy.leave(plate_key)
+        if events:
+            self.event_version = events[-1].id
+
+        for name, version in (await db.execute(select(TableWrites.name, TableWrites.version))).all():
+            if self._writes.get(name) != version:
+                self._writes[name] = version
+                table_versions.bump(name)
+                if name == CARS:
+                    catalog_cache.invalidate()
+        self.polls += 1
+
+    async def _run(self, session_factory):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                async with session_factory() as db:
+                    await self.poll(db)
+            except Exception:
+                # keep following, the next poll catches up
+                self.failed += 1
+
+    # starts the background poll on the running event loop, unless SYNC_INTERVAL is 0
+    def start(self, session_factory):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run(session_factory))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def clear(self):
+        self.plate_version = 0
+        self.event_version = 0
+        self._writes.clear()
+        self.loaded = False
+        self.polls = 0
+        self.plates = 0
+        self.failed = 0
+
+
+change_follower = ChangeFollower()
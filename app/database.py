@@ -1,16 +1,129 @@
 """
     This application creates a sqlite.db file within the project, that's  used as DB.
     Defines the DB configurations.
-    Creates a Session
+    Creates a Session, and the AsyncSessions used by the async request handlers:
+    -   get_write_db - read-write session on the primary, for the endpoints that change data
+    -   get_read_db - session on the read engine, for the gate checks and lists, so they never wait on the
+        connections held by writes. The read engine can point to a replica, on SQLite its connections are query_only
+
+    Configured through environment variables:
+    -   DATABASE_URL - sync SQLAlchemy URL, the async driver is derived from it (default: sqlite:///./parking_management_app.db)
+    -   DATABASE_READ_URL - URL of the replica serving reads (default: DATABASE_URL, with its own connection pool)
+    -   DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT - connection pool settings
+    -   DB_BUSY_TIMEOUT - seconds a SQLite connection waits for a lock before failing
+    -   SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE - SQLite mmap_size (bytes) and cache_size (negative: KiB) pragmas
 """
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .metrics import instrument_engine, timed_pool
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./parking_management_app.db")
+SQLALCHEMY_READ_DATABASE_URL = os.getenv("DATABASE_READ_URL", SQLALCHEMY_DATABASE_URL)
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+
+# async driver used for each backend when DATABASE_URL names none
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+
+
+def async_database_url(database_url: str):
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _engine_options(url, async_engine: bool):
+    if url.get_backend_name() == "sqlite":
+        options = {"connect_args": {"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT}}
+        if _is_sqlite_memory(url):
+            return options
+    else:
+        options = {"pool_pre_ping": True}
+    # aiosqlite defaults to NullPool, the queue pool keeps connections with their page cache and mmap across requests
+    options.update(poolclass=timed_pool(AsyncAdaptedQueuePool if async_engine else QueuePool),
+                   pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./parking_management_app.db"
+# WAL lets readers run while a writer commits, and lets several workers share the file
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.close()
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={'check_same_thread': False})
+
+# connections of the read engine refuse writes, a handler on the wrong session fails instead of writing to a replica
+def set_sqlite_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def create_engines(database_url: str):
+    url = make_url(database_url)
+    sync_engine = create_engine(url, **_engine_options(url, async_engine=False))
+    async_engine = create_async_engine(async_database_url(database_url), **_engine_options(url, async_engine=True))
+    if url.get_backend_name() == "sqlite" and not _is_sqlite_memory(url):
+        event.listen(sync_engine, "connect", set_sqlite_pragmas)
+        event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+    instrument_engine(sync_engine)
+    instrument_engine(async_engine.sync_engine)
+    return sync_engine, async_engine
+
+
+# async engine of the read sessions
+def create_read_engine(database_url: str):
+    url = make_url(database_url)
+    read_engine = create_async_engine(async_database_url(database_url), **_engine_options(url, async_engine=True))
+    if url.get_backend_name() == "sqlite" and not _is_sqlite_memory(url):
+        event.listen(read_engine.sync_engine, "connect", set_sqlite_pragmas)
+        event.listen(read_engine.sync_engine, "connect", set_sqlite_query_only)
+    instrument_engine(read_engine.sync_engine)
+    return read_engine
+
+
+# sync engine, used for schema creation and scripts
+# async engine, used by the API so DB calls never block the event loop
+engine, async_engine = create_engines(SQLALCHEMY_DATABASE_URL)
+# async read engine, used by the API for gate checks and lists
+read_async_engine = create_read_engine(SQLALCHEMY_READ_DATABASE_URL)
 
 SessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine)
 
+AsyncSessionLocal = async_sessionmaker(autoflush=False, autocommit=False, expire_on_commit=False, bind=async_engine)
+
+AsyncReadSessionLocal = async_sessionmaker(autoflush=False, autocommit=False, expire_on_commit=False,
+                                           bind=read_async_engine)
+
 Base = declarative_base()
+
+
+# creates and maintains a read-write DB session until all DB operations are completed
+async def get_write_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# creates and maintains a read-only DB session until all DB operations are completed
+async def get_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
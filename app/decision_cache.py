@@ -0,0 +1,113 @@
+"""
+    Short-lived cache of the gate lookups answered by the DB, and single-flight of the lookups in progress.
+    A camera re-reads the plate of a waiting vehicle many times a second. Plates missing from the plate index,
+    visitors and delivery vans mostly, would otherwise query the DB on every read.
+    -   answers (owner_id, or NOT_FOUND for an unknown plate) are kept for DECISION_CACHE_TTL seconds,
+        at most DECISION_CACHE_SIZE of them, the least recently used are evicted first
+    -   reads of a plate whose lookup is in flight wait for that lookup instead of sending their own,
+        they only look the plate up again when that lookup is cancelled or fails
+    The car write endpoints invalidate the plates they change, see plate_changed() in app/gate.py.
+
+    Configured through environment variables:
+    -   DECISION_CACHE_TTL - seconds an answer is reused (default 2)
+    -   DECISION_CACHE_SIZE - answers kept (default 10000)
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from time import monotonic
+
+from .plate_index import MISSING
+
+DECISION_CACHE_TTL = float(os.getenv("DECISION_CACHE_TTL", "2"))
+DECISION_CACHE_SIZE = int(os.getenv("DECISION_CACHE_SIZE", "10000"))
+
+# cached answer of a plate that belongs to no car
+NOT_FOUND = object()
+
+
+class DecisionCache:
+    """
+        Bounded TTL/LRU map of plate key -> owner_id or NOT_FOUND, with the lookups in flight per plate key.
+    """
+
+    def __init__(self, ttl=DECISION_CACHE_TTL, max_size=DECISION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._answers = OrderedDict()
+        self._in_flight = {}
+        # bumped by every invalidation, an answer read before a write is not cached after it
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lookups = 0
+
+    # returns the cached answer of the plate, or MISSING
+    def get(self, plate_key: int):
+        entry = self._answers.get(plate_key)
+        if entry is None or entry[0] <= monotonic():
+            self.misses += 1
+            return MISSING
+        self._answers.move_to_end(plate_key)
+        self.hits += 1
+        return entry[1]
+
+    # caches the answers of a lookup started at the given generation, unless a write happened since
+    def put(self, answers, generation: int):
+        if generation != self.generation:
+            return
+        expires = monotonic() + self.ttl
+        for plate_key, answer in answers.items():
+            self._answers[plate_key] = (expires, answer)
+            self._answers.move_to_end(plate_key)
+        while len(self._answers) > self.max_size:
+            self._answers.popitem(last=False)
+
+    def invalidate(self, plate_key: int):
+        self.generation += 1
+        self._answers.pop(plate_key, None)
+
+    # future of the lookup in flight for the plate, or None
+    def in_flight(self, plate_key: int):
+        future = self._in_flight.get(plate_key)
+        if future is not None:
+            self.coalesced += 1
+        return future
+
+    # registers a lookup of the plate keys, returns the future resolved by finish_lookup()
+    def start_lookup(self, plate_keys):
+        self.lookups += 1
+        future = asyncio.get_running_loop().create_future()
+        for plate_key in plate_keys:
+            self._in_flight[plate_key] = future
+        return future
+
+    def finish_lookup(self, plate_keys, future, answers=None, error=None):
+        for plate_key in plate_keys:
+            if self._in_flight.get(plate_key) is future:
+                del self._in_flight[plate_key]
+        if isinstance(error, asyncio.CancelledError):
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+            # the waiters get the error, do not report it again when nobody waited
+            future.exception()
+        else:
+            future.set_result(answers)
+
+    def clear(self):
+        self._answers.clear()
+        self._in_flight.clear()
+        self.generation += 1
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lookups = 0
+
+    def stats(self):
+        return {"size": len(self._answers), "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "db_lookups": self.lookups, "saved": self.hits + self.coalesced}
+
+
+decision_cache = DecisionCache()
@@ -0,0 +1,45 @@
+"""
+    Process-local set of the employee ids known to exist, so registering a car does not query the employee again.
+    Loaded at startup and kept up to date by the employee write endpoints. Employees are never deleted, an id
+    missing from the set is looked up in the DB before it is reported as unknown.
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Employees
+
+
+class EmployeeIds:
+    """
+        In-memory set of existing employee ids.
+    """
+
+    def __init__(self):
+        self._ids = set()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._ids)
+
+    # replaces the set with every employee currently stored in the DB
+    async def load(self, db: AsyncSession):
+        self._ids = set((await db.scalars(select(Employees.id))).all())
+        self.loaded = True
+
+    def add(self, *emp_ids):
+        self._ids.update(emp_ids)
+
+    # the given ids that belong to an employee, ids missing from the set are fetched with one IN query
+    async def existing(self, db: AsyncSession, emp_ids):
+        emp_ids = set(emp_ids)
+        missing = emp_ids - self._ids
+        if missing:
+            self._ids.update((await db.scalars(select(Employees.id).filter(Employees.id.in_(missing)))).all())
+        return emp_ids & self._ids
+
+    def clear(self):
+        self._ids.clear()
+        self.loaded = False
+
+
+employee_ids = EmployeeIds()
@@ -0,0 +1,168 @@
+"""
+    Records the entries and exits seen by the gate in the parking_events table.
+    The gate check only appends the event to a bounded in-process queue, so recording never adds a DB write
+    to the gate decision. A background task started by the app lifespan flushes the queue with batched inserts,
+    and drains it on shutdown. A batch that cannot be written stays queued for the next flush, events are only lost
+    when the queue is full or the DB still fails on shutdown.
+    A camera re-reads the plate of a waiting vehicle many times a second: a read with the same plate, direction and
+    decision as the last one of that plate, less than EVENT_REPEAT_WINDOW seconds ago, is counted but not logged.
+
+    Configured through environment variables:
+    -   EVENT_QUEUE_SIZE - events kept waiting for a flush, events are dropped (and counted) once it is full
+    -   EVENT_BATCH_SIZE - events written per insert
+    -   EVENT_FLUSH_INTERVAL - seconds between flushes while the queue is below EVENT_BATCH_SIZE
+    -   EVENT_REPEAT_WINDOW - seconds a repeated read is not logged again, 0 logs every read (default 5)
+"""
+import asyncio
+import os
+import secrets
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Literal
+
+from sqlalchemy import insert
+
+from .metrics import gate_events
+from .models import ParkingEvents
+
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "10000"))
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "500"))
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "1"))
+EVENT_REPEAT_WINDOW = float(os.getenv("EVENT_REPEAT_WINDOW", "5"))
+
+# tags the events of this process, see app/changes.py
+WORKER_ID = secrets.token_hex(8)
+
+ENTRY = "entry"
+EXIT = "exit"
+Direction = Literal["entry", "exit"]
+
+
+class EventRecorder:
+    """
+        Bounded queue of gate events with a background task writing them in batches.
+    """
+
+    def __init__(self, max_queue=EVENT_QUEUE_SIZE, batch_size=EVENT_BATCH_SIZE, flush_interval=EVENT_FLUSH_INTERVAL,
+                 repeat_window=EVENT_REPEAT_WINDOW):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.repeat_window = repeat_window
+        self._queue = deque()
+        # plate -> (monotonic time, direction, allowed, detail) of its last read, oldest read first
+        self._last_reads = OrderedDict()
+        self._session_factory = None
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.repeated = 0
+
+    # True when the plate was last read with the same outcome within the repeat window, the window then slides
+    def _is_repeat(self, plate, direction: str, allowed: bool, detail):
+        now = monotonic()
+        while self._last_reads and next(iter(self._last_reads.values()))[0] <= now - self.repeat_window:
+            self._last_reads.popitem(last=False)
+        last = self._last_reads.pop(plate, None)
+        self._last_reads[plate] = (now, direction, allowed, detail)
+        return last is not None and last[1:] == (direction, allowed, detail)
+
+    # queues one gate event, returns False when the event is a repeated read or is dropped because the queue is full
+    def record(self, number_plate: str, plate_key, direction: str, allowed: bool, detail=None):
+        if self.repeat_window > 0 and self._is_repeat(
+                number_plate if plate_key is None else plate_key, direction, allowed, detail):
+            self.repeated += 1
+            gate_events.inc(("repeated",))
+            return False
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            gate_events.inc(("dropped",))
+            return False
+        self._queue.append({"number_plate": number_plate, "plate_key": plate_key, "direction": direction,
+                            "timestamp": datetime.now(timezone.utc), "allowed": allowed, "detail": detail,
+                            "worker": WORKER_ID})
+        if self._wakeup is not None and len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    # writes every queued event, one insert per batch, returns the number of events written
+    async def flush(self, session_factory=None):
+        session_factory = session_factory or self._session_factory
+        written = 0
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            try:
+                async with session_factory() as db:
+                    await db.execute(insert(ParkingEvents), batch)
+                    await db.commit()
+            except Exception:
+                # a locked or unreachable DB is usually transient: the batch goes back to the front of the queue
+                # for the next flush, only the newest events beyond max_queue are dropped
+                self._queue.extendleft(reversed(batch))
+                overflow = len(self._queue) - self.max_queue
+                for _ in range(max(overflow, 0)):
+                    self._queue.pop()
+                if overflow > 0:
+                    self.dropped += overflow
+                    gate_events.inc(("dropped",), overflow)
+                raise
+            written += len(batch)
+            self.written += len(batch)
+            gate_events.inc(("written",), len(batch))
+        return written
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # keep the gate running, the next flush retries the events still queued
+                pass
+
+    # starts the background writer on the running event loop
+    def start(self, session_factory):
+        self._session_factory = session_factory
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    # stops the background writer once its current flush is done, then writes the events still queued
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._wakeup = None
+        if self._session_factory is not None:
+            try:
+                await self.flush()
+            except Exception:
+                # the DB is gone at shutdown, the events still queued are lost with it
+                self.failed += len(self._queue)
+                gate_events.inc(("failed",), len(self._queue))
+                self._queue.clear()
+
+    def clear(self):
+        self._queue.clear()
+        self._last_reads.clear()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.repeated = 0
+
+    def stats(self):
+        return {"queued": len(self._queue), "written": self.written, "dropped": self.dropped, "failed": self.failed,
+                "repeated": self.repeated, "running": self._task is not None}
+
+
+event_recorder = EventRecorder()
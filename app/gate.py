@@ -0,0 +1,134 @@
+"""
+    Gate decision shared by the HTTP gate check endpoints and the gate controller WebSocket.
+    Plates are compared by their integer key (see app/plates.py), so any spelling of a standard plate matches.
+    Keys are answered from the in-memory plate index, then from the short-lived decision cache which also collapses
+    concurrent lookups of a plate (see app/decision_cache.py), the rest are fetched with one IN query.
+    pass_gate() adds the occupancy check of entries and records the event in the gate event log.
+"""
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .decision_cache import decision_cache, NOT_FOUND
+from .events import event_recorder, EXIT
+from .models import Cars
+from .occupancy import occupancy, CAR_PARK_FULL
+from .plate_index import plate_index, MISSING
+from .plates import INVALID_NUMBER_PLATE
+
+CAR_NOT_FOUND = "Car not found."
+
+
+# returns {plate_key: owner_id} for every key that belongs to a known car, None keys are skipped
+# keys missing from the plate index are answered by the decision cache, or by the lookup of the same key already
+# in flight, the others are fetched with one IN query
+async def lookup_owners(db: AsyncSession, plate_keys):
+    owners = {}
+    missing = set()
+    for plate_key in plate_keys:
+        if plate_key is None or plate_key in owners or plate_key in missing:
+            continue
+        owner_id = plate_index.lookup(plate_key)
+        if owner_id is MISSING:
+            missing.add(plate_key)
+        else:
+            owners[plate_key] = owner_id
+
+    # the keys whose lookup in flight was cancelled or failed are looked up again
+    while missing:
+        missing = await _lookup_missing(db, missing, owners)
+    return owners
+
+
+# answers the keys missing from the plate index into owners, returns the keys to look up again
+async def _lookup_missing(db: AsyncSession, missing, owners):
+    waiting = {}
+    fetched = set()
+    for plate_key in missing:
+        answer = decision_cache.get(plate_key)
+        if answer is MISSING:
+            future = decision_cache.in_flight(plate_key)
+            if future is None:
+                fetched.add(plate_key)
+            else:
+                waiting[plate_key] = future
+        elif answer is not NOT_FOUND:
+            owners[plate_key] = answer
+
+    if fetched:
+        generation = decision_cache.generation
+        future = decision_cache.start_lookup(fetched)
+        try:
+            rows = (await db.execute(
+                select(Cars.plate_key, Cars.owner_id).filter(Cars.plate_key.in_(fetched)))).all()
+        except BaseException as error:
+            decision_cache.finish_lookup(fetched, future, error=error)
+            raise
+        answers = dict.fromkeys(fetched, NOT_FOUND)
+        for plate_key, owner_id in rows:
+            answers[plate_key] = owners[plate_key] = owner_id
+            # a car written during the lookup is already up to date in the index
+            if generation == decision_cache.generation:
+                plate_index.set(plate_key, owner_id)
+        decision_cache.put(answers, generation)
+        decision_cache.finish_lookup(fetched, future, answers)
+
+    retry = set()
+    for plate_key, future in waiting.items():
+        # wait() neither cancels the shared lookup when this read is cancelled, nor raises its outcome
+        await asyncio.wait([future])
+        if future.cancelled() or future.exception() is not None:
+            retry.add(plate_key)
+            continue
+        answer = future.result()[plate_key]
+        if answer is not NOT_FOUND:
+            owners[plate_key] = answer
+    return retry
+
+
+# a car write changed the plate: owner_id is None for a car that is not registered
+def plate_changed(plate_key, owner_id):
+    plate_index.set(plate_key, owner_id)
+    decision_cache.invalidate(plate_key)
+
+
+# a car write removed the plate
+def plate_removed(plate_key):
+    plate_index.discard(plate_key)
+    decision_cache.invalidate(plate_key)
+
+
+# decision for one plate: (registered, detail), registered is None when no decision can be made
+def gate_decision(owners, plate_key):
+    if plate_key is None:
+        return None, INVALID_NUMBER_PLATE
+    if plate_key not in owners:
+        return None, CAR_NOT_FOUND
+    return owners[plate_key] is not None, None
+
+
+# decision of the barrier for a car about to enter: (registered, allowed, detail), nothing is recorded
+def entry_decision(owners, plate_key):
+    registered, detail = gate_decision(owners, plate_key)
+    allowed = registered is True
+    if allowed and not occupancy.can_enter(plate_key):
+        allowed, detail = False, CAR_PARK_FULL
+    return registered, allowed, detail
+
+
+# decision of the barrier for a car seen entering or leaving: (registered, allowed, detail)
+# a registered car is refused entry when the car park is full, the event is queued for the gate event log
+# any car with a valid plate is let out, even one deleted or unregistered while inside, so its space is freed
+def pass_gate(owners, number_plate: str, plate_key, direction: str):
+    registered, detail = gate_decision(owners, plate_key)
+    if direction == EXIT:
+        allowed = plate_key is not None
+        if allowed:
+            occupancy.leave(plate_key)
+    else:
+        allowed = registered is True
+        if allowed and not occupancy.enter(plate_key, number_plate):
+            allowed, detail = False, CAR_PARK_FULL
+    event_recorder.record(number_plate, plate_key, direction, allowed, detail)
+    return registered, allowed, detail
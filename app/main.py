@@ -1,22 +1,145 @@
 """
     This file starts the application.
     Creates an instance of FastAPI().
-    And a /healthy endpoint to check health of the application.
+    And a /healthy endpoint to check health of the application, /healthy/ready once the caches are warm.
+    Creates or upgrades the schema on startup, not at import, then loads the in-memory plate index and employee ids.
+    Runs the background writer of the gate event log (app/events.py) for the lifetime of the app.
+    Polls the writes of the other workers (app/changes.py) for the lifetime of the app.
+    Rebuilds the car park occupancy from the gate event log on startup, a /occupancy endpoint reports it.
+    A /ws/gate WebSocket lets gate controllers stream plate reads over one persistent connection.
+    A /metrics endpoint exposes request, SQL and connection pool metrics in the Prometheus text format.
+    Heavy admin requests go through admission control (app/admission.py) so gate checks never queue behind them,
+    /admission/stats reports it.
 """
-from fastapi import FastAPI
-from .models import Base
-from .database import engine
+import json
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from starlette import status
+
+from .admission import AdmissionMiddleware, admission
+from .changes import change_follower
+from .database import engine, AsyncSessionLocal, AsyncReadSessionLocal
+from .employee_ids import employee_ids
+from .events import event_recorder, ENTRY, EXIT
+from .gate import lookup_owners, pass_gate
+from .metrics import MetricsMiddleware, render_metrics
+from .plates import number_plate_key
+from .schema import create_schema
+from .occupancy import occupancy
+from .plate_index import plate_index
 from .routers import car, employee
 
-app = FastAPI()
 
-Base.metadata.create_all(bind=engine)
+# warm the plate index and employee ids so gate checks and registrations are answered from memory,
+# and count the cars inside
+async def warm_up(session_factory=AsyncReadSessionLocal):
+    async with session_factory() as db:
+        # changes written from now on are polled again, the caches loaded next cannot miss them
+        await change_follower.load(db)
+        await plate_index.load(db)
+        await employee_ids.load(db)
+        await occupancy.load(db)
+
+
+def is_ready():
+    return change_follower.loaded and plate_index.loaded and employee_ids.loaded and occupancy.loaded
+
+
+# create or upgrade the schema, a no-op once the DB file is at the current schema version, then warm up
+# write the gate events in the background, and the ones still queued on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    create_schema(engine)
+    await warm_up()
+    event_recorder.start(AsyncSessionLocal)
+    change_follower.start(AsyncReadSessionLocal)
+    yield
+    await change_follower.stop()
+    await event_recorder.stop()
+
+
+# responses are rendered with orjson, list endpoints validate their rows against typed response models
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# admission control runs inside the metrics middleware, so rejected requests are counted
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(car.router)
 app.include_router(employee.router)
 
 
-# Health check endpoint
+# Health check endpoint, liveness: the process serves requests
 @app.get("/healthy/")
 def health_check():
     return {"status": "Healthy"}
+
+
+# Readiness probe: 503 until the schema is set up and the caches are warm
+@app.get("/healthy/ready")
+def readiness_check(response: Response):
+    if is_ready():
+        return {"status": "Ready"}
+    response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "Starting"}
+
+
+# spaces used and left, answered from memory
+@app.get("/occupancy")
+async def get_occupancy():
+    return occupancy.stats()
+
+
+# number plates of the cars inside
+@app.get("/occupancy/cars")
+async def get_cars_inside():
+    return occupancy.cars_inside()
+
+
+# slots of the admission control in use, and the heavy requests admitted and rejected
+@app.get("/admission/stats")
+async def get_admission_stats():
+    return admission.stats()
+
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# Gate controller channel
+# each message is {"id": <correlation id>, "number_plate": "LLNN LLL", "direction": "entry"|"exit" (default entry)}
+# each reply is {"id": <same id>, "number_plate": ..., "allow": true|false, "detail": null|<reason>}
+@app.websocket("/ws/gate")
+async def gate_websocket(websocket: WebSocket, db: car.read_db_dependency):
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            correlation_id = None
+            try:
+                request = json.loads(message)
+                # the reply to a JSON object carries its id, even when the rest of the message is invalid
+                if isinstance(request, dict):
+                    correlation_id = request.get("id")
+                number_plate = request["number_plate"]
+                direction = request.get("direction", ENTRY)
+                if not isinstance(number_plate, str) or direction not in (ENTRY, EXIT):
+                    raise TypeError
+            except (ValueError, KeyError, TypeError, AttributeError):
+                await websocket.send_text(json.dumps(
+                    {"id": correlation_id, "allow": False, "detail": "Invalid message."}))
+                continue
+
+            plate_key = number_plate_key(number_plate)
+            owners = await lookup_owners(db, [plate_key])
+            if db.in_transaction():
+                # do not keep a read transaction open between vehicles
+                await db.rollback()
+            registered, allowed, detail = pass_gate(owners, number_plate, plate_key, direction)
+            await websocket.send_text(json.dumps(
+                {"id": correlation_id, "number_plate": number_plate, "allow": allowed, "detail": detail}))
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,261 @@
+"""
+    Operational metrics exposed at /metrics in the Prometheus text format.
+    -   per-route request counts and latency histograms, recorded by MetricsMiddleware
+    -   SQL statement count and duration per request, recorded from the engine's cursor execute events
+    -   connection pool checkout wait time, recorded by the pool classes returned by timed_pool()
+    -   gate events written, dropped on a full queue or lost on a failed insert, recorded by app/events.py
+    Recording is a few dict lookups and a bisect per observation, cheap enough to leave on in production.
+
+    With SERVER_TIMING=1 every response also carries a Server-Timing header with the DB time and query count of
+    the request, the time spent turning the endpoint's return value into the response (response model validation,
+    serialization and rendering of the body) and the total time, for the browser's dev tools:
+    Server-Timing: db;dur=1.204;desc="3 queries", render;dur=0.151, total;dur=4.870
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from bisect import bisect_left
+from time import perf_counter
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "") == "1"
+
+
+class Histogram:
+    """
+        Prometheus histogram with one series per label values tuple.
+    """
+
+    def __init__(self, name, documentation, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, value, label_values=()):
+        series = self._series.get(label_values)
+        if series is None:
+            # one counter per bucket plus +Inf, then the sum
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def clear(self):
+        self._series.clear()
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            labels = _labels(self.label_names, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            lines.append(f"{_series(self.name + '_sum', labels)} {series[-1]}")
+            lines.append(f"{_series(self.name + '_count', labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    """
+        Prometheus counter with one series per label values tuple.
+    """
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._series = {}
+
+    def inc(self, label_values=(), amount=1):
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def clear(self):
+        self._series.clear()
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._series.items()):
+            lines.append(f"{_series(self.name, _labels(self.label_names, label_values))} {value}")
+        return lines
+
+
+def _labels(label_names, label_values):
+    return ",".join(f'{name}="{value}"' for name, value in zip(label_names, label_values))
+
+
+def _series(name, labels):
+    return f"{name}{{{labels}}}" if labels else name
+
+
+http_requests = Counter("http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+http_request_sql_statements = Histogram("http_request_sql_statements", "SQL statements executed per HTTP request.",
+                                        ("method", "route"), COUNT_BUCKETS)
+http_request_sql_duration = Histogram("http_request_sql_duration_seconds", "Time spent in SQL per HTTP request.",
+                                       ("method", "route"))
+sql_statement_duration = Histogram("sql_statement_duration_seconds", "SQL statement execution time.", ())
+pool_checkout_wait = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection.", ())
+gate_events = Counter("gate_events_total", "Gate events by outcome: written, dropped, failed or repeated.", ("outcome",))
+
+REGISTRY = [http_requests, http_request_duration, http_request_sql_statements, http_request_sql_duration,
+            sql_statement_duration, pool_checkout_wait, gate_events]
+
+
+class SqlTally:
+    """
+        SQL statement count and duration of the current request, and the time spent building its response.
+    """
+    __slots__ = ("statements", "duration", "render", "returned")
+
+    def __init__(self):
+        self.statements = 0
+        self.duration = 0.0
+        self.render = 0.0
+        # when the endpoint returned, set by TimedAPIRoute
+        self.returned = None
+
+
+_current_sql_tally = contextvars.ContextVar("current_sql_tally", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = perf_counter() - conn.info["query_started"].pop()
+    sql_statement_duration.observe(duration)
+    tally = _current_sql_tally.get()
+    if tally is not None:
+        tally.statements += 1
+        tally.duration += duration
+
+
+# records statement timings of a sync engine (use AsyncEngine.sync_engine for async engines)
+def instrument_engine(engine):
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# subclass of a pool class that records how long each checkout waited for a connection
+def timed_pool(pool_class):
+    class TimedPool(pool_class):
+        def _do_get(self):
+            started = perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                pool_checkout_wait.observe(perf_counter() - started)
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+
+# wraps an endpoint to note in the tally of the current request when it returned
+def _note_return(call):
+    def note():
+        tally = _current_sql_tally.get()
+        if tally is not None:
+            tally.returned = perf_counter()
+
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def noted_call(*args, **kwargs):
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                note()
+    else:
+        @functools.wraps(call)
+        def noted_call(*args, **kwargs):
+            try:
+                return call(*args, **kwargs)
+            finally:
+                note()
+    noted_call.notes_return = True
+    return noted_call
+
+
+class TimedAPIRoute(APIRoute):
+    """
+        APIRoute recording in the tally of the current request the time from the endpoint's return to the finished
+        response: response model validation, serialization and rendering of the body.
+    """
+
+    def get_route_handler(self):
+        # wrap the call of the already built dependant, so parameters and the response model are still read from
+        # the endpoint itself
+        if not getattr(self.dependant.call, "notes_return", False):
+            self.dependant.call = _note_return(self.dependant.call)
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            tally = _current_sql_tally.get()
+            if tally is not None and tally.returned is not None:
+                tally.render += perf_counter() - tally.returned
+            return response
+
+        return timed_handler
+
+
+def server_timing(tally: SqlTally, total: float):
+    return (f'db;dur={tally.duration * 1000:.3f};desc="{tally.statements} queries", '
+            f'render;dur={tally.render * 1000:.3f}, total;dur={total * 1000:.3f}')
+
+
+class MetricsMiddleware:
+    """
+        ASGI middleware recording count, latency and SQL usage of each HTTP request per route template,
+        and adding the Server-Timing header when SERVER_TIMING is on.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        status_code = 500
+        tally = SqlTally()
+        token = _current_sql_tally.set(tally)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if SERVER_TIMING:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", server_timing(tally, perf_counter() - started).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current_sql_tally.reset(token)
+            route = scope.get("route")
+            # label by route template, so plates in the path do not create a series each
+            labels = (scope["method"], route.path if route is not None else "unmatched")
+            http_requests.inc(labels + (status_code,))
+            http_request_duration.observe(perf_counter() - started, labels)
+            http_request_sql_statements.observe(tally.statements, labels)
+            http_request_sql_duration.observe(tally.duration, labels)
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
@@ -1,24 +1,86 @@
 """
     Describes the database schema.
     Describe Tables and its columns.
+    employees_fts is the SQLite FTS5 index over employee names, created by app/schema.py.
 """
 from .database import Base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from .plates import number_plate_key
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, table, column, insert_sentinel
+from sqlalchemy.orm import validates
 
 
 class Employees(Base):
     __tablename__ = "employees"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String)
+    name = Column(String, index=True)
+    # filled by SQLAlchemy during multi-row inserts, so RETURNING rows are matched to the inserted rows on SQLite
+    _sentinel = insert_sentinel("_sentinel")
 
 
 class Cars(Base):
     __tablename__ = "cars"
 
     id = Column(Integer, primary_key=True, index=True)
-    make = Column(String)
+    make = Column(String, index=True)
     model = Column(String)
     color = Column(String)
     number_plate = Column(String, unique=True)
-    owner_id = Column(Integer, ForeignKey("employees.id"))
+    # integer encoding of number_plate, see app/plates.py
+    plate_key = Column(Integer, unique=True, index=True)
+    owner_id = Column(Integer, ForeignKey("employees.id"), index=True)
+    # case-folded make, see normalize_make(), the make search and the catalog compare makes on it
+    make_key = Column(String, index=True)
+
+    @validates("number_plate")
+    def _set_plate_key(self, key, number_plate):
+        self.plate_key = number_plate_key(number_plate)
+        return number_plate
+
+    @validates("make")
+    def _set_make_key(self, key, make):
+        self.make_key = normalize_make(make)
+        return make
+
+
+# makes compared case-insensitively, folded in Python because SQLite lower() only folds ASCII letters
+def normalize_make(make):
+    return None if make is None else make.casefold()
+
+
+# entries and exits seen by the gate, written in batches by app/events.py
+class ParkingEvents(Base):
+    __tablename__ = "parking_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    number_plate = Column(String)
+    plate_key = Column(Integer, index=True)
+    # "entry" or "exit"
+    direction = Column(String)
+    timestamp = Column(DateTime(timezone=True), index=True)
+    # gate decision, detail gives the reason of a refusal when there is one
+    allowed = Column(Boolean)
+    detail = Column(String)
+    # process that recorded the event, other workers apply its entries and exits to their occupancy
+    worker = Column(String)
+
+
+# registrations and unregistrations of plates, its ids version the plate snapshot (see app/plate_snapshot.py)
+class PlateChanges(Base):
+    __tablename__ = "plate_changes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    plate_key = Column(Integer)
+    registered = Column(Boolean)
+
+
+# write counter per table, bumped in the transaction of every API write so other workers see it (see app/versions.py)
+class TableWrites(Base):
+    __tablename__ = "table_writes"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# external content FTS5 table over employees.name, its rowid is the employee id
+employees_fts = table("employees_fts", column("rowid"), column("employees_fts"))
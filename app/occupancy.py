@@ -0,0 +1,87 @@
+"""
+    Process-local occupancy of the car park, used by the gate to refuse entries once it is full.
+    Keeps the cars currently inside by plate key (see app/plates.py), so counting them is O(1) and the gate
+    never runs a COUNT query per vehicle.
+    Rebuilt at startup from the last allowed entry or exit of every plate in parking_events (see app/events.py),
+    then kept up to date by the gate, and by the poll of app/changes.py for the cars let in or out by other workers.
+
+    Configured through environment variables:
+    -   PARKING_CAPACITY - number of spaces, 0 (default) disables the capacity check
+"""
+import os
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import ParkingEvents
+
+PARKING_CAPACITY = int(os.getenv("PARKING_CAPACITY", "0"))
+
+CAR_PARK_FULL = "Car park is full."
+
+
+class Occupancy:
+    """
+        Cars inside the car park, plate key -> number plate, with the capacity they are checked against.
+    """
+
+    def __init__(self, capacity=PARKING_CAPACITY):
+        self.capacity = capacity
+        self._inside = {}
+        self.refused = 0
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._inside)
+
+    # replaces the cars inside with the plates whose last allowed event is an entry
+    async def load(self, db: AsyncSession):
+        last_events = (select(func.max(ParkingEvents.id))
+                       .filter(ParkingEvents.allowed.is_(True), ParkingEvents.plate_key.is_not(None))
+                       .group_by(ParkingEvents.plate_key))
+        rows = (await db.execute(select(ParkingEvents.plate_key, ParkingEvents.number_plate)
+                                 .filter(ParkingEvents.id.in_(last_events), ParkingEvents.direction == "entry"))).all()
+        self._inside = {plate_key: number_plate for plate_key, number_plate in rows}
+        self.loaded = True
+
+    def is_full(self):
+        return 0 < self.capacity <= len(self._inside)
+
+    # whether the car would be let in, without recording its entry
+    def can_enter(self, plate_key: int):
+        return plate_key in self._inside or not self.is_full()
+
+    # records the entry of a car, returns False when the car park is full
+    # a car already inside is let in again, its exit was probably not read
+    def enter(self, plate_key: int, number_plate: str):
+        if plate_key in self._inside:
+            return True
+        if self.is_full():
+            self.refused += 1
+            return False
+        self._inside[plate_key] = number_plate
+        return True
+
+    # records an entry already let in by another worker, whatever the capacity
+    def arrived(self, plate_key: int, number_plate: str):
+        self._inside[plate_key] = number_plate
+
+    def leave(self, plate_key: int):
+        self._inside.pop(plate_key, None)
+
+    def cars_inside(self):
+        return list(self._inside.values())
+
+    def clear(self):
+        self._inside.clear()
+        self.refused = 0
+        self.loaded = False
+
+    def stats(self):
+        occupied = len(self._inside)
+        return {"capacity": self.capacity or None, "occupied": occupied,
+                "available": max(self.capacity - occupied, 0) if self.capacity else None,
+                "full": self.is_full(), "refused": self.refused}
+
+
+occupancy = Occupancy()
@@ -0,0 +1,90 @@
+"""
+    Keyset pagination and streamed list responses shared by the routers.
+    Pages are selected with "id > after_id ORDER BY id LIMIT n", so every page costs the same whatever its position.
+    Streamed responses read rows from a server-side cursor and never hold the whole table in memory,
+    as a JSON array for the list endpoints or as NDJSON/CSV for the exports.
+"""
+import csv
+import io
+from typing import Annotated, Literal
+
+import orjson
+
+from fastapi import Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# rows fetched from the server-side cursor per round trip when streaming
+STREAM_CHUNK_SIZE = 500
+
+NEXT_PAGE_HEADER = "X-Next-After-Id"
+
+# query parameters of the list endpoints
+after_id_query = Annotated[int, Query(ge=0, description="Return rows with an id greater than this cursor")]
+limit_query = Annotated[int, Query(gt=0, le=MAX_PAGE_SIZE, description="Maximum number of rows per page")]
+stream_query = Annotated[bool, Query(description="Stream every row after the cursor instead of a single page")]
+
+
+# points the client to the next page when the current one is full
+def set_next_page(response: Response, last_id: int, page_length: int, limit: int):
+    if page_length == limit:
+        response.headers[NEXT_PAGE_HEADER] = str(last_id)
+
+
+# yields the rows of the statement from a server-side cursor, a partition of STREAM_CHUNK_SIZE mappings at a time
+async def _partitions(db: AsyncSession, statement):
+    try:
+        result = await db.stream(statement.execution_options(yield_per=STREAM_CHUNK_SIZE))
+        async for partition in result.mappings().partitions():
+            yield partition
+    finally:
+        # the request's session is handed over to the stream, which outlives the request dependencies
+        await db.close()
+
+
+# yields the rows of the statement as one JSON array, chunk by chunk
+async def _json_array_chunks(db: AsyncSession, statement):
+    yield b"["
+    separator = b""
+    async for partition in _partitions(db, statement):
+        yield separator + b",".join(orjson.dumps(dict(row)) for row in partition)
+        separator = b","
+    yield b"]"
+
+
+# yields the rows of the statement as newline delimited JSON, one object per line
+async def _ndjson_chunks(db: AsyncSession, statement):
+    async for partition in _partitions(db, statement):
+        yield b"".join(orjson.dumps(dict(row), option=orjson.OPT_APPEND_NEWLINE) for row in partition)
+
+
+# yields the rows of the statement as CSV, the header first so the client gets it before the query runs
+async def _csv_chunks(db: AsyncSession, statement):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(statement.selected_columns.keys())
+    yield buffer.getvalue()
+    async for partition in _partitions(db, statement):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(row.values() for row in partition)
+        yield buffer.getvalue()
+
+
+# streamed JSON array response of a column projection
+def stream_json_array(db: AsyncSession, statement, headers=None):
+    return StreamingResponse(_json_array_chunks(db, statement), media_type="application/json", headers=headers)
+
+
+EXPORT_FORMATS = {"ndjson": (_ndjson_chunks, "application/x-ndjson"), "csv": (_csv_chunks, "text/csv; charset=utf-8")}
+export_format_query = Annotated[Literal["ndjson", "csv"], Query(alias="format", description="ndjson or csv")]
+
+
+# streamed download of a column projection, as NDJSON or CSV
+def stream_export(db: AsyncSession, statement, export_format: str, file_name: str):
+    chunks, media_type = EXPORT_FORMATS[export_format]
+    return StreamingResponse(chunks(db, statement), media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{file_name}.{export_format}"'})
@@ -0,0 +1,64 @@
+"""
+    Process-local index of number plates used by the gate check.
+    Maps the integer key of every known number plate (see app/plates.py) to its owner_id,
+    None when the car is not registered.
+    Loaded at startup and kept up to date by the car write endpoints, plates written by another worker are dropped
+    from it by the poll of app/changes.py and read again from the DB.
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Cars
+
+# sentinel returned by lookup() when the plate is not in the index
+MISSING = object()
+
+
+class PlateIndex:
+    """
+        In-memory plate key -> owner_id map with hit/miss counters.
+    """
+
+    def __init__(self):
+        self._owners = {}
+        self.hits = 0
+        self.misses = 0
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._owners)
+
+    # replaces the index content with every car currently stored in the DB
+    async def load(self, db: AsyncSession):
+        rows = (await db.execute(select(Cars.plate_key, Cars.owner_id).filter(Cars.plate_key.is_not(None)))).all()
+        self._owners = {plate_key: owner_id for plate_key, owner_id in rows}
+        self.loaded = True
+
+    # returns the owner_id of the plate, or MISSING when the plate is not indexed
+    def lookup(self, plate_key: int):
+        owner_id = self._owners.get(plate_key, MISSING)
+        if owner_id is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return owner_id
+
+    # plates that are not standard have no key and are never indexed
+    def set(self, plate_key: int, owner_id):
+        if plate_key is not None:
+            self._owners[plate_key] = owner_id
+
+    def discard(self, plate_key: int):
+        self._owners.pop(plate_key, None)
+
+    def clear(self):
+        self._owners.clear()
+        self.hits = 0
+        self.misses = 0
+        self.loaded = False
+
+    def stats(self):
+        return {"size": len(self._owners), "hits": self.hits, "misses": self.misses, "loaded": self.loaded}
+
+
+plate_index = PlateIndex()
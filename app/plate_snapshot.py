@@ -0,0 +1,85 @@
+"""
+    Compact binary snapshot of the registered number plates, for gate controllers that must decide offline.
+    A snapshot is a 20 byte header followed by the sorted integer keys (see app/plates.py) of the registered plates,
+    as little-endian uint32:
+    -   magic b"PLSN", format version (uint16), reserved (uint16)
+    -   version (uint64), the id of the last plate_changes row the snapshot includes
+    -   key count (uint32)
+    The file can be memory-mapped as is and searched with bisect, 50k plates take 200 KB.
+    Controllers keep it current with the changes since their version (GET /car/snapshot/changes?since=),
+    see PlateSnapshot below, which only needs this module and app/plates.py.
+"""
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from .plates import number_plate_key
+
+MAGIC = b"PLSN"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHQI")
+MEDIA_TYPE = "application/vnd.parking.plate-snapshot"
+
+
+def encode_snapshot(version: int, plate_keys):
+    keys = array("I", sorted(plate_keys))
+    if sys.byteorder != "little":
+        keys.byteswap()
+    return HEADER.pack(MAGIC, FORMAT_VERSION, 0, version, len(keys)) + keys.tobytes()
+
+
+# (version, key count) of a snapshot, raises ValueError when the buffer is not a snapshot
+def decode_header(buffer):
+    if len(buffer) < HEADER.size:
+        raise ValueError("Not a plate snapshot.")
+    magic, format_version, _, version, count = HEADER.unpack_from(buffer)
+    if magic != MAGIC or format_version != FORMAT_VERSION or len(buffer) < HEADER.size + 4 * count:
+        raise ValueError("Not a plate snapshot.")
+    return version, count
+
+
+class PlateSnapshot:
+    """
+        Registered plates of a snapshot, checked with a binary search over the sorted keys.
+    """
+
+    def __init__(self, buffer):
+        self.version, count = decode_header(buffer)
+        self._buffer = buffer
+        keys = memoryview(buffer)[HEADER.size:HEADER.size + 4 * count]
+        if sys.byteorder == "little":
+            self._keys = keys.cast("I")
+        else:
+            self._keys = array("I", keys)
+            self._keys.byteswap()
+
+    # memory-maps a snapshot file, the keys are read from the page cache rather than copied
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as file:
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, number_plate: str):
+        plate_key = number_plate_key(number_plate)
+        if plate_key is None:
+            return False
+        position = bisect_left(self._keys, plate_key)
+        return position < len(self._keys) and self._keys[position] == plate_key
+
+    # new snapshot with the changes of GET /car/snapshot/changes applied
+    def apply_changes(self, changes):
+        keys = set(self._keys)
+        for change in changes["changes"]:
+            if change["registered"]:
+                keys.add(change["plate_key"])
+            else:
+                keys.discard(change["plate_key"])
+        return PlateSnapshot(encode_snapshot(changes["version"], keys))
+
+    def to_bytes(self):
+        return bytes(self._buffer[:HEADER.size + 4 * len(self._keys)])
@@ -0,0 +1,62 @@
+"""
+    Number plate normalization and integer encoding.
+    A standard LLNN LLL plate is normalized to upper case with a single space, e.g. " ab01  def" -> "AB01 DEF".
+    A normalized plate is encoded to an integer below 2**31 (26*26*100*26*26*26 values),
+    so plates are compared and indexed as integers instead of strings.
+"""
+import re
+import string
+from typing import Annotated, Optional
+
+from pydantic import AfterValidator
+
+INVALID_NUMBER_PLATE = "Invalid number plate."
+
+_PLATE_PATTERN = re.compile(r"([A-Z]{2})([0-9]{2}) ?([A-Z]{3})")
+_WHITESPACE = re.compile(r"\s+")
+_LETTERS = string.ascii_uppercase
+
+
+# returns the plate in its "LLNN LLL" form, or None when it is not a standard plate
+def normalize_number_plate(number_plate: str) -> Optional[str]:
+    match = _PLATE_PATTERN.fullmatch(_WHITESPACE.sub(" ", number_plate.strip()).upper())
+    if match is None:
+        return None
+    return f"{match[1]}{match[2]} {match[3]}"
+
+
+# encodes a normalized plate, letters are base 26 digits and the number a base 100 digit
+def encode_plate(normalized_plate: str) -> int:
+    key = (ord(normalized_plate[0]) - 65) * 26 + ord(normalized_plate[1]) - 65
+    key = key * 100 + int(normalized_plate[2:4])
+    for character in normalized_plate[5:]:
+        key = key * 26 + ord(character) - 65
+    return key
+
+
+def decode_plate(key: int) -> str:
+    key, l5 = divmod(key, 26)
+    key, l4 = divmod(key, 26)
+    key, l3 = divmod(key, 26)
+    key, number = divmod(key, 100)
+    l1, l2 = divmod(key, 26)
+    return f"{_LETTERS[l1]}{_LETTERS[l2]}{number:02d} {_LETTERS[l3]}{_LETTERS[l4]}{_LETTERS[l5]}"
+
+
+# integer key of any plate spelling, or None when it is not a standard plate
+def number_plate_key(number_plate: str) -> Optional[int]:
+    normalized_plate = normalize_number_plate(number_plate)
+    if normalized_plate is None:
+        return None
+    return encode_plate(normalized_plate)
+
+
+def validate_number_plate(number_plate: str) -> str:
+    normalized_plate = normalize_number_plate(number_plate)
+    if normalized_plate is None:
+        raise ValueError(INVALID_NUMBER_PLATE)
+    return normalized_plate
+
+
+# request field type: validates the LLNN LLL layout and normalizes the plate
+NumberPlate = Annotated[str, AfterValidator(validate_number_plate)]
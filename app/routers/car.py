@@ -1,45 +1,66 @@
 """
     Defines the API router for:
     -   POST - /car - Add a new employee
-    -   GET - /car - Get all cars
-    -   GET - /car/{car_make} - Filter cars by "car_make"
+    -   POST - /car/bulk - Add a list of cars in one transaction, with an error per rejected car
+    -   GET - /car - Get all cars (paginated with ?after_id=&limit=, or streamed with ?stream=true),
+        with an ETag, 304 on If-None-Match while no car changed
+    -   GET - /car/snapshot - GET the registered plates as a binary snapshot, for gate controllers deciding offline
+    -   GET - /car/snapshot/changes?since= - GET the plates registered or unregistered after a snapshot version
+    -   GET - /car/catalog - GET makes with their models and number of cars, cached until a car changes
+    -   GET - /car/{car_make} - Filter cars by "car_make", case-insensitive prefix (paginated with ?after_id=&limit=)
     -   PUT - /car/{car_id} - Update Car
     -   DELETE - /car/{car_id} - Delete Car
 
+    -   PUT - /car/register/bulk - Add a list of cars to employees in one transaction, with an error per rejected car
     -   PUT - /car/register/{number_plate} - Add car to an employee
-    -   GET - /car/register/ - GET all registered Cars with employees
+    -   GET - /car/register/ - GET all registered Cars with employees (paginated or streamed), with an ETag
+    -   GET - /car/register/export?format=ndjson|csv - Download every registered car with its owner, streamed
     -   GET - /car/register/{emp_name} - GET cars registered for a particular employee
 
-    -   GET - /car/is_registered/{number_plate} - GET number plate is registered or not
+    -   GET - /car/is_registered/{number_plate}?direction=entry|exit - GET number plate is registered or not,
+        false with an X-Gate-Detail header when the car park is full, the read is recorded in the gate event log,
+        exits of a car deleted or unregistered while inside are let out
+    -   POST - /car/is_registered - Check a batch of number plates in one request, allowed is false once the car
+        park is full
+    -   GET - /car/plate_index/stats - GET size and hit/miss counters of the in-memory plate index
+    -   GET - /car/decision_cache/stats - GET hit/miss counters of the gate decision cache and the lookups it saved
 """
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Path
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import select, delete, insert, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from app.database import SessionLocal
-from app.models import Cars, Employees
+from app.catalog import catalog_cache
+from app.database import get_read_db, get_write_db
+from app.models import Cars, Employees, PlateChanges, normalize_make
+from app.pagination import (DEFAULT_PAGE_SIZE, after_id_query, limit_query, stream_query, set_next_page,
+                            stream_json_array, export_format_query, stream_export)
+from app.events import Direction, ENTRY
+from app.decision_cache import decision_cache
+from app.employee_ids import employee_ids
+from app.gate import lookup_owners, entry_decision, pass_gate, plate_changed, plate_removed
+from app.plate_index import plate_index
+from app.metrics import TimedAPIRoute
+from app.plate_snapshot import encode_snapshot, MEDIA_TYPE
+from app.plates import NumberPlate, number_plate_key
+from app.versions import table_versions, not_modified, record_write, CARS, EMPLOYEES
 
 router = APIRouter(
     prefix="/car",
-    tags=["Car"]
+    tags=["Car"],
+    route_class=TimedAPIRoute
 )
 
 
-# creates and maintains a DB session until all DB operations are completed
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# DB session of the endpoints that change data
+write_db_dependency = Annotated[AsyncSession, Depends(get_write_db)]
 
-
-# create a new DB connection
-db_dependency = Annotated[Session, Depends(get_db)]
+# DB session of the endpoints that only read, may be served by a replica
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
 
 
 class CarRequest(BaseModel):
@@ -49,132 +70,365 @@ class CarRequest(BaseModel):
     make: str = Field(min_length=2, default="Toyota")
     model: str = Field(min_length=1, default="Yaris")
     color: str = Field(min_length=2, default="White")
-    number_plate: str = Field(max_length=8, min_length=8, default="AB01 DEF")
+    number_plate: NumberPlate = Field(default="AB01 DEF")
 
 
 class AddCarRequest(BaseModel):
     """
                 Defines code to validate add_car_to_emp request against defined constrains
     """
-    number_plate: str = Field(max_length=8, min_length=8, default="AB01 DEF")
+    number_plate: NumberPlate = Field(default="AB01 DEF")
     owner_id: int = Field(gt=0, default=1)
 
 
+class BulkCarRequest(BaseModel):
+    """
+                Defines code to validate a bulk create cars request against defined constrains
+    """
+    cars: list[CarRequest] = Field(min_length=1, max_length=1000)
+
+
+class BulkAddCarRequest(BaseModel):
+    """
+                Defines code to validate a bulk add_car_to_emp request against defined constrains
+    """
+    registrations: list[AddCarRequest] = Field(min_length=1, max_length=1000)
+
+
+class GateCheckRequest(BaseModel):
+    """
+                Defines code to validate a batch of number plates read by the gate camera
+    """
+    number_plates: list[str] = Field(min_length=1, max_length=100, default=["AB01 DEF"])
+
+
+class CarOut(BaseModel):
+    """
+                Defines the car returned by the car list endpoints
+    """
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    make: str | None
+    model: str | None
+    color: str | None
+    number_plate: str | None
+    owner_id: int | None
+
+
+class RegisteredCarOut(CarOut):
+    """
+                Defines the car returned by the registered cars endpoints, with the name of its owner
+    """
+    name: str | None
+
+
 # create a car
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def add_car(db: db_dependency, car_request: CarRequest):
+async def add_car(db: write_db_dependency, car_request: CarRequest):
     car_model = Cars(**car_request.model_dump())
     db.add(car_model)
-    db.commit()
+    await record_write(db, CARS)
+    await db.commit()
+    plate_changed(car_model.plate_key, None)
+    catalog_cache.invalidate()
+    table_versions.bump(CARS)
+
+
+# create a list of cars: one query finds the plates already taken, one insert creates the others
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def add_cars(db: write_db_dependency, bulk_car_request: BulkCarRequest):
+    plate_keys = [number_plate_key(car_request.number_plate) for car_request in bulk_car_request.cars]
+    taken = set((await db.scalars(select(Cars.plate_key).filter(Cars.plate_key.in_(set(plate_keys))))).all())
+
+    results = []
+    new_cars = []
+    for car_request, plate_key in zip(bulk_car_request.cars, plate_keys):
+        result = {"number_plate": car_request.number_plate, "id": None, "detail": None}
+        if plate_key in taken:
+            result["detail"] = "Car already exists."
+        else:
+            taken.add(plate_key)
+            new_cars.append({**car_request.model_dump(), "plate_key": plate_key,
+                             "make_key": normalize_make(car_request.make)})
+        results.append(result)
+
+    if new_cars:
+        ids = dict((await db.execute(insert(Cars).returning(Cars.plate_key, Cars.id), new_cars)).all())
+        await record_write(db, CARS)
+        await db.commit()
+        for result, plate_key in zip(results, plate_keys):
+            if result["detail"] is None:
+                result["id"] = ids[plate_key]
+                plate_changed(plate_key, None)
+        catalog_cache.invalidate()
+        table_versions.bump(CARS)
+    return results
+
+
+# columns returned by the car endpoints
+car_columns = (Cars.id, Cars.make, Cars.model, Cars.color, Cars.number_plate, Cars.owner_id)
 
 
 # Get all cars
-@router.get("/", status_code=status.HTTP_200_OK)
-async def get_all_cars(db: db_dependency):
-    car_list = db.query(Cars).all()
+# answered with 304 while If-None-Match holds the ETag of the current cars version
+@router.get("/", status_code=status.HTTP_200_OK, response_model=list[CarOut])
+async def get_all_cars(db: read_db_dependency, request: Request, response: Response,
+                       after_id: after_id_query = 0, limit: limit_query = DEFAULT_PAGE_SIZE,
+                       stream: stream_query = False):
+    etag = table_versions.etag(request, CARS)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    if stream:
+        return stream_json_array(db, select(*car_columns).filter(Cars.id > after_id).order_by(Cars.id),
+                                 headers={"ETag": etag})
+
+    car_list = (await db.execute(
+        select(*car_columns).filter(Cars.id > after_id).order_by(Cars.id).limit(limit))).mappings().all()
     if len(car_list) > 0:
+        set_next_page(response, car_list[-1]["id"], len(car_list), limit)
+        response.headers["ETag"] = etag
         return car_list
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No cars found.")
 
 
-# get(Filter) cars my make
-@router.get("/{car_make}", status_code=status.HTTP_200_OK)
-async def get_car_by_make(db: db_dependency, car_make: str):
-    car_model = db.query(Cars).filter(Cars.make == car_make).all()
+# registered plates as a binary snapshot (see app/plate_snapshot.py), versioned by the last plate change
+@router.get("/snapshot", status_code=status.HTTP_200_OK, response_class=Response)
+async def get_plate_snapshot(db: read_db_dependency):
+    version = await db.scalar(select(func.coalesce(func.max(PlateChanges.id), 0)))
+    plate_keys = (await db.scalars(select(Cars.plate_key)
+                                   .filter(Cars.owner_id.is_not(None), Cars.plate_key.is_not(None)))).all()
+    return Response(encode_snapshot(version, plate_keys), media_type=MEDIA_TYPE,
+                    headers={"X-Snapshot-Version": str(version)})
+
+
+# plates registered or unregistered after the given snapshot version, the last change of each plate only
+@router.get("/snapshot/changes", status_code=status.HTTP_200_OK)
+async def get_plate_changes(db: read_db_dependency, since: Annotated[int, Query(ge=0)]):
+    rows = (await db.execute(select(PlateChanges.id, PlateChanges.plate_key, PlateChanges.registered)
+                             .filter(PlateChanges.id > since).order_by(PlateChanges.id))).all()
+    if rows:
+        version = rows[-1].id
+    else:
+        version = await db.scalar(select(func.coalesce(func.max(PlateChanges.id), 0)))
+        if since > version:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown snapshot version.")
+    changes = {plate_key: registered for _, plate_key, registered in rows}
+    return {"version": version,
+            "changes": [{"plate_key": plate_key, "registered": registered} for plate_key, registered in changes.items()]}
+
+
+# makes with their models and number of cars, from one grouped query cached until a car is written
+@router.get("/catalog", status_code=status.HTTP_200_OK)
+async def get_catalog(db: read_db_dependency):
+    catalog = await catalog_cache.get(db)
+    if len(catalog) > 0:
+        return catalog
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No cars found.")
+
+
+# get(Filter) cars my make, case-insensitive prefix, paginated like the list of all cars
+# a range on make_key rather than LIKE, so SQLite searches ix_cars_make_key
+# the cursor is compared on id + 0, a bare id range would make SQLite walk the primary key instead
+@router.get("/{car_make}", status_code=status.HTTP_200_OK, response_model=list[CarOut])
+async def get_car_by_make(db: read_db_dependency, response: Response, car_make: str,
+                          after_id: after_id_query = 0, limit: limit_query = DEFAULT_PAGE_SIZE):
+    prefix = normalize_make(car_make)
+    car_model = (await db.execute(select(*car_columns)
+                                  .filter(Cars.make_key >= prefix,
+                                          Cars.make_key < prefix[:-1] + chr(ord(prefix[-1]) + 1),
+                                          Cars.id + 0 > after_id)
+                                  .order_by(Cars.id).limit(limit))).mappings().all()
     if len(car_model) > 0:
+        set_next_page(response, car_model[-1]["id"], len(car_model), limit)
         return car_model
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No cars found.")
 
 
 # Update car
 @router.put("/{car_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def update_car(db: db_dependency,
+async def update_car(db: write_db_dependency,
                      car_request: CarRequest,
                      car_id: int = Path(gt=0)):
-    car_model = db.query(Cars).filter(Cars.id == car_id).first()
+    car_model = await db.scalar(select(Cars).filter(Cars.id == car_id))
     if car_model is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found.")
 
     car_model.make = car_request.make
     car_model.model = car_request.model
     car_model.color = car_request.color
+    plate_key, owner_id = car_model.plate_key, car_model.owner_id
 
     db.add(car_model)
-    db.commit()
+    await record_write(db, CARS)
+    await db.commit()
+    plate_changed(plate_key, owner_id)
+    catalog_cache.invalidate()
+    table_versions.bump(CARS)
 
 
 # Delete a car
 @router.delete("/{car_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_car(db: db_dependency, car_id: int = Path(gt=0)):
-    car_model = db.query(Cars).filter(Cars.id == car_id).first()
-    if car_model is None:
+async def delete_car(db: write_db_dependency, car_id: int = Path(gt=0)):
+    # one statement deletes the car and returns what the plate index needs
+    deleted = (await db.execute(
+        delete(Cars).filter(Cars.id == car_id).returning(Cars.plate_key, Cars.owner_id))).first()
+    if deleted is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found.")
 
-    db.query(Cars).filter(Cars.id == car_id).delete()
-    db.commit()
+    plate_key, owner_id = deleted
+    if owner_id is not None and plate_key is not None:
+        db.add(PlateChanges(plate_key=plate_key, registered=False))
+    await record_write(db, CARS)
+    await db.commit()
+    plate_removed(plate_key)
+    catalog_cache.invalidate()
+    table_versions.bump(CARS)
+
+
+# ADD a list of cars to Employees: one query for the cars, one for the employees not cached yet,
+# one executemany update
+@router.put("/register/bulk", status_code=status.HTTP_200_OK)
+async def add_cars_to_employees(db: write_db_dependency, bulk_add_car_request: BulkAddCarRequest):
+    registrations = bulk_add_car_request.registrations
+    plate_keys = [number_plate_key(add_car_request.number_plate) for add_car_request in registrations]
+    cars = {plate_key: (car_id, owner_id) for plate_key, car_id, owner_id in (await db.execute(
+        select(Cars.plate_key, Cars.id, Cars.owner_id).filter(Cars.plate_key.in_(set(plate_keys))))).all()}
+    emp_ids = await employee_ids.existing(db, [add_car_request.owner_id for add_car_request in registrations])
+
+    results = []
+    updates = {}
+    for add_car_request, plate_key in zip(registrations, plate_keys):
+        result = {"number_plate": add_car_request.number_plate, "owner_id": add_car_request.owner_id, "detail": None}
+        if plate_key not in cars:
+            result["detail"] = "Car not found."
+        elif add_car_request.owner_id not in emp_ids:
+            result["detail"] = "Employee not found."
+        elif plate_key in updates:
+            result["detail"] = "Duplicate number plate."
+        else:
+            updates[plate_key] = add_car_request.owner_id
+        results.append(result)
+
+    if updates:
+        await db.execute(update(Cars), [{"id": cars[plate_key][0], "owner_id": owner_id}
+                                        for plate_key, owner_id in updates.items()])
+        newly_registered = [{"plate_key": plate_key, "registered": True} for plate_key in updates
+                            if cars[plate_key][1] is None]
+        if newly_registered:
+            await db.execute(insert(PlateChanges), newly_registered)
+        await record_write(db, CARS)
+        await db.commit()
+        for plate_key, owner_id in updates.items():
+            plate_changed(plate_key, owner_id)
+        table_versions.bump(CARS)
+    return results
 
 
 # ADD a car to Employee
 @router.put("/register/{number_plate}", status_code=status.HTTP_201_CREATED)
-async def add_car_to_employee(db: db_dependency, add_car_request: AddCarRequest, number_plate: str):
-    car_model = db.query(Cars).filter(Cars.number_plate == number_plate).first()
+async def add_car_to_employee(db: write_db_dependency, add_car_request: AddCarRequest, number_plate: str):
+    plate_key = number_plate_key(number_plate)
+    car_model = None if plate_key is None else await db.scalar(select(Cars).filter(Cars.plate_key == plate_key))
     if car_model is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found.")
 
-    emp_model = db.query(Employees).filter(Employees.id == add_car_request.owner_id).first()
-    if emp_model is None:
+    if not await employee_ids.existing(db, [add_car_request.owner_id]):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Employee not found.")
 
+    if car_model.owner_id is None:
+        db.add(PlateChanges(plate_key=plate_key, registered=True))
     car_model.owner_id = add_car_request.owner_id
 
     db.add(car_model)
-    db.commit()
+    await record_write(db, CARS)
+    await db.commit()
+    plate_changed(plate_key, add_car_request.owner_id)
+    table_versions.bump(CARS)
 
 
-# Get all registered cars
-@router.get("/register/", status_code=status.HTTP_200_OK)
-async def get_registered_cars(db: db_dependency):
-    car_list = db.query(Cars.id, Cars.make, Cars.color, Cars.model, Cars.owner_id, Cars.number_plate, Employees.id,
-                        Employees.name).filter(Cars.owner_id is not None).join(Employees,
-                                                                               Cars.owner_id == Employees.id).all()
+# cars joined with their owner, projected to the columns returned by the registered cars endpoints
+def registered_cars_query():
+    return (select(Cars.id, Cars.make, Cars.color, Cars.model, Cars.owner_id, Cars.number_plate, Employees.name)
+            .join(Employees, Cars.owner_id == Employees.id)
+            .filter(Cars.owner_id.is_not(None)))
 
-    car_list1 = db.query(Cars).all()
+
+# Get all registered cars
+# answered with 304 while If-None-Match holds the ETag of the current cars and employees versions
+@router.get("/register/", status_code=status.HTTP_200_OK, response_model=list[RegisteredCarOut])
+async def get_registered_cars(db: read_db_dependency, request: Request, response: Response,
+                              after_id: after_id_query = 0, limit: limit_query = DEFAULT_PAGE_SIZE,
+                              stream: stream_query = False):
+    etag = table_versions.etag(request, CARS, EMPLOYEES)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    query = registered_cars_query().filter(Cars.id > after_id).order_by(Cars.id)
+    if stream:
+        return stream_json_array(db, query, headers={"ETag": etag})
+
+    car_list = (await db.execute(query.limit(limit))).mappings().all()
     if len(car_list) > 0:
-        b = []
-        for i in car_list:
-            b.append(i._asdict())
-        return b
+        set_next_page(response, car_list[-1]["id"], len(car_list), limit)
+        response.headers["ETag"] = etag
+        return car_list
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No cars found.")
 
 
-#  get cars registered for a particular employee
-@router.get("/register/{emp_name}", status_code=status.HTTP_200_OK)
-async def get_registered_cars_by_emp_name(db: db_dependency, emp_name: str):
-    car_list = db.query(Cars.id, Cars.make, Cars.color, Cars.model, Cars.owner_id, Cars.number_plate, Employees.id,
-                        Employees.name).filter(
-        Cars.owner_id is not None and Employees.name == emp_name).join(Employees,
-                                                                       Cars.owner_id == Employees.id).all()
+# Download all registered cars with their owner, streamed from a server-side cursor in constant memory
+@router.get("/register/export", status_code=status.HTTP_200_OK)
+async def export_registered_cars(db: read_db_dependency, export_format: export_format_query = "ndjson"):
+    return stream_export(db, registered_cars_query().order_by(Cars.id), export_format, "registered_cars")
+
 
+#  get cars registered for a particular employee
+@router.get("/register/{emp_name}", status_code=status.HTTP_200_OK, response_model=list[RegisteredCarOut])
+async def get_registered_cars_by_emp_name(db: read_db_dependency, emp_name: str):
+    car_list = (await db.execute(
+        registered_cars_query().filter(Employees.name == emp_name).order_by(Cars.id))).mappings().all()
     if len(car_list) > 0:
-        b = []
-        for i in car_list:
-            b.append(i._asdict())
-        return b
+        return car_list
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car cars found.")
 
 
 # checks if given number plate is registered or not
 @router.get("/is_registered/{number_plate}", status_code=status.HTTP_200_OK)
-async def is_car_registered_to_emp(db: db_dependency, number_plate: str):
-    number_plate_list = number_plate.split(" ")
-    if " " not in number_plate or len(number_plate_list[0]) != 4 or len(number_plate_list[1]) != 3:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invalid number plate.")
-
-    car_model = db.query(Cars).filter(Cars.number_plate == number_plate).first()
-    if car_model is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found.")
-
-    if car_model.owner_id is None:
-        return False
-    else:
-        return True
\ No newline at end of file
+async def is_car_registered_to_emp(db: read_db_dependency, response: Response, number_plate: str,
+                                   direction: Direction = ENTRY):
+    plate_key = number_plate_key(number_plate)
+    owners = await lookup_owners(db, [plate_key])
+    registered, allowed, detail = pass_gate(owners, number_plate, plate_key, direction)
+    # an unknown car is still let out, the detail says why it is not registered
+    if registered is None and not allowed:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+    if detail is not None:
+        response.headers["X-Gate-Detail"] = detail
+    return allowed
+
+
+# checks a batch of number plates, plates missing from the index are fetched with a single IN query
+# allowed applies the capacity check of an entry, the entries themselves are recorded by the gate check of the car
+@router.post("/is_registered", status_code=status.HTTP_200_OK)
+async def are_cars_registered_to_emp(db: read_db_dependency, gate_check_request: GateCheckRequest):
+    plate_keys = [number_plate_key(number_plate) for number_plate in gate_check_request.number_plates]
+    owners = await lookup_owners(db, plate_keys)
+    results = []
+    for number_plate, plate_key in zip(gate_check_request.number_plates, plate_keys):
+        registered, allowed, detail = entry_decision(owners, plate_key)
+        results.append({"number_plate": number_plate, "registered": registered, "allowed": allowed,
+                        "detail": detail})
+    return results
+
+
+# size and hit/miss counters of the in-memory plate index
+@router.get("/plate_index/stats", status_code=status.HTTP_200_OK)
+async def get_plate_index_stats():
+    return plate_index.stats()
+
+
+# hit/miss counters of the gate decision cache, and the DB lookups saved by it and by single-flight
+@router.get("/decision_cache/stats", status_code=status.HTTP_200_OK)
+async def get_decision_cache_stats():
+    return decision_cache.stats()
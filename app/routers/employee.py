@@ -1,36 +1,42 @@
 """
     Defines the API router for:
     -   POST - /emp - Add a new employee
-    -   GET - /emp - Get all employees
+    -   POST - /emp/bulk - Add a list of employees in one transaction
+    -   GET - /emp - Get all employees (paginated with ?after_id=&limit=, or streamed with ?stream=true),
+        with an ETag, 304 on If-None-Match while no employee was added
+    -   GET - /emp/search?name= - Case-insensitive word prefix search on employee names, every searched word
+        starts a word of the name
 
 """
+import re
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import select, insert, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from app.database import SessionLocal
-from app.models import Employees
+from app.database import get_read_db, get_write_db
+from app.employee_ids import employee_ids
+from app.models import Employees, employees_fts
+from app.metrics import TimedAPIRoute
+from app.pagination import (DEFAULT_PAGE_SIZE, after_id_query, limit_query, stream_query, set_next_page,
+                            stream_json_array)
+from app.versions import table_versions, not_modified, record_write, EMPLOYEES
 
 router = APIRouter(
     prefix="/emp",
-    tags=["Emp"]
+    tags=["Emp"],
+    route_class=TimedAPIRoute
 )
 
 
-# creates and maintains a DB session until all DB operations are completed
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# DB session of the endpoints that change data
+write_db_dependency = Annotated[AsyncSession, Depends(get_write_db)]
 
-
-# create a new DB connection
-db_dependency = Annotated[Session, Depends(get_db)]
+# DB session of the endpoints that only read, may be served by a replica
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
 
 
 class EmpRequest(BaseModel):
@@ -40,18 +46,107 @@ class EmpRequest(BaseModel):
     name: str = Field(min_length=2, default="Employee Name")
 
 
+class BulkEmpRequest(BaseModel):
+    """
+        Defines code to validate a bulk create employees request against defined constrains
+    """
+    employees: list[EmpRequest] = Field(min_length=1, max_length=5000)
+
+
+class EmployeeOut(BaseModel):
+    """
+        Defines the employee returned by the employee list endpoints
+    """
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str | None
+
+
 # create an employee
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def add_emp(db: db_dependency, emp_request: EmpRequest):
+async def add_emp(db: write_db_dependency, emp_request: EmpRequest):
     emp_model = Employees(**emp_request.model_dump())
     db.add(emp_model)
-    db.commit()
+    await record_write(db, EMPLOYEES)
+    await db.commit()
+    employee_ids.add(emp_model.id)
+    table_versions.bump(EMPLOYEES)
+
+
+# create a list of employees with one multi-row insert, returns their ids in request order
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def add_emps(db: write_db_dependency, bulk_emp_request: BulkEmpRequest):
+    result = await db.execute(insert(Employees).returning(Employees.id, sort_by_parameter_order=True),
+                              [emp_request.model_dump() for emp_request in bulk_emp_request.employees])
+    ids = result.scalars().all()
+    await record_write(db, EMPLOYEES)
+    await db.commit()
+    employee_ids.add(*ids)
+    table_versions.bump(EMPLOYEES)
+    return {"ids": ids}
 
 
 # get all employees
-@router.get("/", status_code=status.HTTP_200_OK)
-async def get_all_employees(db: db_dependency):
-    emp_list = db.query(Employees).all()
+# answered with 304 while If-None-Match holds the ETag of the current employees version
+@router.get("/", status_code=status.HTTP_200_OK, response_model=list[EmployeeOut])
+async def get_all_employees(db: read_db_dependency, request: Request, response: Response,
+                            after_id: after_id_query = 0, limit: limit_query = DEFAULT_PAGE_SIZE,
+                            stream: stream_query = False):
+    etag = table_versions.etag(request, EMPLOYEES)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    if stream:
+        return stream_json_array(db, select(Employees.id, Employees.name).filter(Employees.id > after_id)
+                                 .order_by(Employees.id), headers={"ETag": etag})
+
+    emp_list = (await db.scalars(select(Employees).filter(Employees.id > after_id).order_by(Employees.id)
+                                 .limit(limit))).all()
+    if len(emp_list) > 0:
+        set_next_page(response, emp_list[-1].id, len(emp_list), limit)
+        response.headers["ETag"] = etag
+        return emp_list
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No employees found.")
+
+
+# searched words: runs of letters and digits, as the FTS5 tokenizer splits names (underscore included)
+def _search_words(name: str):
+    return re.findall(r"[^\W_]+", name)
+
+
+# builds an FTS5 query matching names where every searched word starts a word of the name
+def _fts_prefix_query(words):
+    return " ".join(f'"{word}"*' for word in words)
+
+
+# characters splitting the words of a name in the fallback search, the ones FTS5 splits on in employee names
+WORD_SEPARATORS = (" ", "-", "'", "’", ".", "_", ",")
+
+
+# the same match without the FTS5 index, for databases other than SQLite: every searched word starts the name
+# or follows one of the WORD_SEPARATORS in it
+def _word_prefix_filter(words):
+    return and_(*(or_(Employees.name.istartswith(word, autoescape=True),
+                      *(Employees.name.icontains(separator + word, autoescape=True) for separator in WORD_SEPARATORS))
+                  for word in words))
+
+
+# search employees by word prefix: every searched word starts a word of the name, in any order
+@router.get("/search", status_code=status.HTTP_200_OK, response_model=list[EmployeeOut])
+async def search_employees(db: read_db_dependency, name: Annotated[str, Query(min_length=1)],
+                           limit: limit_query = DEFAULT_PAGE_SIZE):
+    words = _search_words(name)
+    if not words:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No employees found.")
+    query = select(Employees).order_by(Employees.id).limit(limit)
+    if db.bind.dialect.name == "sqlite":
+        query = query.join(employees_fts, employees_fts.c.rowid == Employees.id).filter(
+            employees_fts.c.employees_fts.match(_fts_prefix_query(words)))
+    else:
+        query = query.filter(_word_prefix_filter(words))
+
+    emp_list = (await db.scalars(query)).all()
     if len(emp_list) > 0:
         return emp_list
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No employees found.")
@@ -0,0 +1,111 @@
+"""
+    Creates the database schema and upgrades existing database files in place.
+    The applied schema version is kept in SQLite's user_version pragma, upgrades only run when it is behind.
+    Maintains the employees_fts full text index used by the employee name search.
+"""
+from sqlalchemy import Engine, inspect, select, insert, update, bindparam
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from .database import Base
+from .models import Cars, TableWrites, normalize_make
+from .plates import number_plate_key
+from .versions import VERSIONED_TABLES
+
+# bump when indexes, tables or columns are added so existing DB files get upgraded on startup
+# 1: secondary indexes and employees_fts
+# 2: cars.plate_key
+# 3: parking_events
+# 4: ix_cars_make_lower
+# 5: plate_changes
+# 6: table_writes
+# 7: employees._sentinel
+# 8: parking_events.worker
+# 9: cars.make_key, replaces ix_cars_make_lower
+SCHEMA_VERSION = 9
+
+EMPLOYEES_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS employees_fts USING fts5(name, content='employees', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS employees_fts_insert AFTER INSERT ON employees BEGIN "
+    "INSERT INTO employees_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS employees_fts_delete AFTER DELETE ON employees BEGIN "
+    "INSERT INTO employees_fts(employees_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS employees_fts_update AFTER UPDATE OF name ON employees BEGIN "
+    "INSERT INTO employees_fts(employees_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO employees_fts(rowid, name) VALUES (new.id, new.name); END",
+    # index the employees that existed before the full text table
+    "INSERT INTO employees_fts(employees_fts) VALUES ('rebuild')",
+]
+
+
+def get_schema_version(connection):
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+# adds the columns declared on the models but missing from existing tables
+def _add_missing_columns(connection):
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+
+
+# computes plate_key for cars stored before the column existed
+# plates that are not standard, or that collide once normalized, keep a NULL key
+def _backfill_plate_keys(connection):
+    used_keys = set(connection.scalars(select(Cars.plate_key).filter(Cars.plate_key.is_not(None))))
+    updates = []
+    for car_id, number_plate in connection.execute(
+            select(Cars.id, Cars.number_plate).filter(Cars.plate_key.is_(None)).order_by(Cars.id)):
+        key = number_plate_key(number_plate) if number_plate else None
+        if key is not None and key not in used_keys:
+            used_keys.add(key)
+            updates.append({"car_id": car_id, "key": key})
+    if updates:
+        connection.execute(update(Cars).where(Cars.id == bindparam("car_id")).values(plate_key=bindparam("key")),
+                           updates)
+
+
+# computes make_key for cars stored before the column existed
+def _backfill_make_keys(connection):
+    updates = [{"car_id": car_id, "key": normalize_make(make)} for car_id, make in connection.execute(
+        select(Cars.id, Cars.make).filter(Cars.make_key.is_(None), Cars.make.is_not(None)))]
+    if updates:
+        connection.execute(update(Cars).where(Cars.id == bindparam("car_id")).values(make_key=bindparam("key")),
+                           updates)
+
+
+# adds the write counter of every versioned table, see app/versions.py
+def _seed_table_writes(connection):
+    existing = set(connection.scalars(select(TableWrites.name)))
+    missing = [{"name": name, "version": 0} for name in VERSIONED_TABLES if name not in existing]
+    if missing:
+        connection.execute(insert(TableWrites), missing)
+
+
+# creates missing tables, then upgrades an older DB file to SCHEMA_VERSION
+def create_schema(bind: Engine):
+    with bind.begin() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite and get_schema_version(connection) >= SCHEMA_VERSION:
+            return
+
+        Base.metadata.create_all(bind=connection)
+        _add_missing_columns(connection)
+        _backfill_plate_keys(connection)
+        _backfill_make_keys(connection)
+        _seed_table_writes(connection)
+        # create_all only creates the indexes of new tables, add the ones missing on existing tables
+        # IF NOT EXISTS rather than checkfirst, expression indexes are not reflected
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
+        if sqlite:
+            # the make search used lower(make) before cars.make_key
+            connection.exec_driver_sql("DROP INDEX IF EXISTS ix_cars_make_lower")
+            for statement in EMPLOYEES_FTS_DDL:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
@@ -0,0 +1,107 @@
+"""
+    Tests the admission control of heavy requests
+    -   GET - /admission/stats
+"""
+import asyncio
+
+from starlette import status
+
+from .utils import *
+from ..admission import AdmissionController, is_heavy
+from ..database import get_read_db, get_write_db
+
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
+
+
+def test_is_heavy():
+    assert is_heavy({"type": "http", "method": "GET", "path": "/car/"})
+    assert is_heavy({"type": "http", "method": "GET", "path": "/car/register/export"})
+    assert is_heavy({"type": "http", "method": "GET", "path": "/car/snapshot"})
+    assert is_heavy({"type": "http", "method": "GET", "path": "/car/Toyota"})
+    assert is_heavy({"type": "http", "method": "HEAD", "path": "/emp/"})
+    assert is_heavy({"type": "http", "method": "POST", "path": "/emp/bulk"})
+    assert is_heavy({"type": "http", "method": "PUT", "path": "/car/register/bulk"})
+    # single-row writes, small reads and gate checks
+    assert not is_heavy({"type": "http", "method": "POST", "path": "/car/"})
+    assert not is_heavy({"type": "http", "method": "POST", "path": "/emp/"})
+    assert not is_heavy({"type": "http", "method": "PUT", "path": "/car/1"})
+    assert not is_heavy({"type": "http", "method": "DELETE", "path": "/car/1"})
+    assert not is_heavy({"type": "http", "method": "GET", "path": "/car/catalog"})
+    assert not is_heavy({"type": "http", "method": "GET", "path": "/car/snapshot/changes"})
+    assert not is_heavy({"type": "http", "method": "GET", "path": "/car/is_registered/AB12 CDE"})
+    assert not is_heavy({"type": "websocket", "path": "/ws/gate"})
+
+
+def test_heavy_requests_are_rejected_when_saturated(test_register_car_to_emp):
+    # every slot is taken by requests that are still running
+    admission.limit, admission.timeout, admission.active = 1, 0, 1
+    try:
+        response = client.get("/car/")
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"] == "1"
+        assert response.json() == {'detail': 'Server busy, retry later.'}
+
+        # gate checks are always admitted
+        assert client.get("/car/is_registered/ZX10 MNB").json() == True
+        with client.websocket_connect("/ws/gate") as websocket:
+            websocket.send_json({'id': 1, 'number_plate': 'ZX10 MNB'})
+            assert websocket.receive_json()['allow'] == True
+
+        admission.release()
+        assert client.get("/car/").status_code == status.HTTP_200_OK
+        assert client.get("/admission/stats").json() == {'limit': 1, 'active': 0, 'waiting': 0, 'admitted': 1,
+                                                         'rejected': 1}
+    finally:
+        admission.limit, admission.timeout = AdmissionController().limit, AdmissionController().timeout
+
+
+def test_waiting_requests_get_freed_slots_in_order():
+    controller = AdmissionController(limit=1, timeout=1)
+    order = []
+
+    async def request(name, duration):
+        if await controller.acquire():
+            order.append(name)
+            await asyncio.sleep(duration)
+            controller.release()
+        else:
+            order.append(f"{name} rejected")
+
+    async def run():
+        await asyncio.gather(request("first", 0.05), request("second", 0), request("third", 0))
+
+    asyncio.run(run())
+    assert order == ["first", "second", "third"]
+    assert controller.stats() == {'limit': 1, 'active': 0, 'waiting': 0, 'admitted': 3, 'rejected': 0}
+
+    controller = AdmissionController(limit=1, timeout=0.01)
+
+    async def saturated():
+        await asyncio.gather(request("first", 0.1), request("second", 0))
+
+    order.clear()
+    asyncio.run(saturated())
+    assert order == ["first", "second rejected"]
+
+
+# release() hands the slot over right as the timeout of its waiter fires, the request keeps the slot
+def test_slot_handed_over_at_timeout_is_not_lost(monkeypatch):
+    controller = AdmissionController(limit=1, timeout=1)
+    controller.active = 1
+
+    async def handed_over_then(exception):
+        async def wait_for(waiter, timeout):
+            controller.release()
+            raise exception
+        with monkeypatch.context() as patch:
+            patch.setattr(asyncio, "wait_for", wait_for)
+            return await controller.acquire()
+
+    assert asyncio.run(handed_over_then(asyncio.TimeoutError())) == True
+    assert controller.stats() == {'limit': 1, 'active': 1, 'waiting': 0, 'admitted': 1, 'rejected': 0}
+
+    # a cancelled request passes the slot on
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(handed_over_then(asyncio.CancelledError()))
+    assert controller.stats() == {'limit': 1, 'active': 0, 'waiting': 0, 'admitted': 1, 'rejected': 0}
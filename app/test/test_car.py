@@ -2,22 +2,30 @@
     Tests API endpoint for car
     -   POST - /car - Add a new employee
     -   GET - /car - Get all cars
-    -   GET - /car/{car_make} - Filter cars by "car_make"
+    -   GET - /car/catalog - GET makes with their models and number of cars
+    -   GET - /car/{car_make} - Filter cars by "car_make" (paginated)
     -   PUT - /car/{car_id} - Update Car
     -   DELETE - /car/{car_id} - Delete Car
 
     -   PUT - /car/register/{number_plate} - Add car to an employee
     -   GET - /car/register/ - GET all registered Cars with employees
+    -   GET - /car/register/export?format=ndjson|csv - Download registered cars with their owner
     -   GET - /car/register/{emp_name} - GET cars registered for a particular employee
 
     -   GET - /car/is_registered/{number_plate} - GET number plate is registered or not
 """
+import asyncio
+import json
+
 from starlette import status
 
 from .utils import *
-from ..routers.car import get_db
+from ..database import get_read_db, get_write_db
+from ..models import PlateChanges
+from ..plates import number_plate_key
 
-app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
 
 
 def test_add_car(test_car):
@@ -62,6 +70,95 @@ def test_get_car_by_make(test_car):
     ]
 
 
+def test_get_car_by_make_prefix(test_car):
+    db = TestingSessionLocal()
+    db.add(Cars(make="TOYOTA", model="Prius", color="Black", number_plate="AS98 GHJ"))
+    db.add(Cars(make="Tesla", model="Model 3", color="Red", number_plate="AB12 CDE"))
+    db.commit()
+
+    with QueryCounter() as queries:
+        response = client.get("/car/toy")
+    assert response.status_code == status.HTTP_200_OK
+    assert [car['number_plate'] for car in response.json()] == ['ZX10 MNB', 'AS98 GHJ']
+    assert "USING INDEX ix_cars_make_key" in queries.query_plans()[0][0]
+
+    assert [car['make'] for car in client.get("/car/T").json()] == ['Toyota', 'TOYOTA', 'Tesla']
+
+
+# makes are folded in Python, SQLite lower() would leave Š as it is
+def test_get_car_by_make_unicode(test_car):
+    client.post("/car/", json={'color': 'Green', 'make': 'Škoda', 'model': 'Octavia', 'number_plate': 'AS98 GHJ'})
+    client.post("/car/bulk", json={'cars': [{'color': 'Red', 'make': 'ŠKODA', 'model': 'Fabia',
+                                             'number_plate': 'AB12 CDE'}]})
+
+    for make in ["Škoda", "škoda", "Šk", "ŠKO"]:
+        response = client.get(f"/car/{make}")
+        assert response.status_code == status.HTTP_200_OK, make
+        assert [car['number_plate'] for car in response.json()] == ['AS98 GHJ', 'AB12 CDE']
+    assert client.get("/car/sk").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_get_car_by_make_paginated(test_car):
+    db = TestingSessionLocal()
+    db.add(Cars(make="Ford", model="Focus", color="Blue", number_plate="CD34 EFG"))
+    db.add(Cars(make="Toyota", model="Prius", color="Black", number_plate="AS98 GHJ"))
+    db.commit()
+
+    response = client.get("/car/toy", params={"limit": 1})
+    assert [car['id'] for car in response.json()] == [1]
+    assert response.headers['X-Next-After-Id'] == '1'
+
+    with QueryCounter() as queries:
+        response = client.get("/car/toy", params={"after_id": 1, "limit": 1})
+    assert [car['id'] for car in response.json()] == [3]
+    assert "USING INDEX ix_cars_make_key" in queries.query_plans()[0][0]
+
+    response = client.get("/car/toy", params={"after_id": 3, "limit": 1})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_get_catalog(test_car):
+    db = TestingSessionLocal()
+    db.add(Cars(make="Toyota", model="Prius", color="Black", number_plate="AS98 GHJ"))
+    db.add(Cars(make="Toyota", model="Fortuner", color="Red", number_plate="AB12 CDE"))
+    db.add(Cars(make="Ford", model="Focus", color="Blue", number_plate="CD34 EFG"))
+    db.commit()
+
+    response = client.get("/car/catalog")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {'make': 'Ford', 'count': 1, 'models': [{'model': 'Focus', 'count': 1}]},
+        {'make': 'Toyota', 'count': 3, 'models': [{'model': 'Fortuner', 'count': 2}, {'model': 'Prius', 'count': 1}]}
+    ]
+
+    # cached until a car is written through the API
+    with QueryCounter() as queries:
+        assert client.get("/car/catalog").json() == response.json()
+    assert queries.count == 0
+
+    assert client.delete("/car/4").status_code == status.HTTP_204_NO_CONTENT
+    assert client.get("/car/catalog").json()[0]['make'] == 'Toyota'
+    assert catalog_cache.hits == 1 and catalog_cache.misses == 2
+
+
+# makes are grouped case-insensitively, like the make search
+def test_get_catalog_groups_makes_case_insensitively(test_car):
+    db = TestingSessionLocal()
+    db.add(Cars(make="TOYOTA", model="Prius", color="Black", number_plate="AS98 GHJ"))
+    db.add(Cars(make="toyota", model="Fortuner", color="Red", number_plate="AB12 CDE"))
+    db.commit()
+
+    assert client.get("/car/catalog").json() == [
+        {'make': 'TOYOTA', 'count': 3, 'models': [{'model': 'Fortuner', 'count': 2}, {'model': 'Prius', 'count': 1}]}
+    ]
+
+
+def test_get_catalog_not_found():
+    response = client.get("/car/catalog")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {'detail': 'No cars found.'}
+
+
 def test_get_car_by_make_not_found():
     response = client.get("/car/unknown_make")
     assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -227,3 +324,310 @@ def test_is_car_registered_to_emp_car_not_found():
     assert response.json() == {"detail": "Car not found."}
 
 
+def test_is_car_registered_to_emp_served_from_plate_index(test_register_car_to_emp):
+    assert client.get("/car/is_registered/ZX10 MNB").json() == True
+
+    # another worker deleted the car: the index answers without a DB lookup until the change is polled
+    db = TestingSessionLocal()
+    db.query(Cars).delete()
+    db.add(PlateChanges(plate_key=number_plate_key("ZX10 MNB"), registered=False))
+    db.commit()
+
+    with QueryCounter() as queries:
+        response = client.get("/car/is_registered/ZX10 MNB")
+    assert response.json() == True
+    assert queries.count == 0
+    assert client.get("/car/plate_index/stats").json()["hits"] == 2
+
+    asyncio.run(poll_changes())
+    assert client.get("/car/is_registered/ZX10 MNB").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_delete_car_removes_plate_from_index(test_car):
+    assert client.get("/car/is_registered/ZX10 MNB").json() == False
+
+    client.delete("/car/1")
+
+    response = client.get("/car/is_registered/ZX10 MNB")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert client.get("/car/plate_index/stats").json() == {'size': 0, 'hits': 0, 'misses': 2, 'loaded': False}
+
+
+def test_get_all_cars_paginated(test_car):
+    client.post("/car", json={'color': 'Black', 'make': 'Toyota', 'model': 'Prius', 'number_plate': 'AS98 GHJ'})
+
+    response = client.get("/car?limit=1")
+    assert response.status_code == status.HTTP_200_OK
+    assert [car['id'] for car in response.json()] == [1]
+    assert response.headers['X-Next-After-Id'] == '1'
+
+    response = client.get("/car?after_id=1&limit=1")
+    assert [car['id'] for car in response.json()] == [2]
+
+    response = client.get("/car?after_id=2&limit=1")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_get_all_cars_streamed(test_car):
+    client.post("/car", json={'color': 'Black', 'make': 'Toyota', 'model': 'Prius', 'number_plate': 'AS98 GHJ'})
+
+    response = client.get("/car?stream=true&after_id=1")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {'color': 'Black', 'id': 2, 'owner_id': None, 'make': 'Toyota', 'model': 'Prius', 'number_plate': 'AS98 GHJ'}
+    ]
+
+
+def test_get_registered_cars_streamed(test_register_car_to_emp):
+    response = client.get("/car/register/?stream=true")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {
+            'id': 1,
+            'make': 'Toyota',
+            'color': 'White',
+            'model': 'Fortuner',
+            'owner_id': 1,
+            'number_plate': 'ZX10 MNB',
+            'name': 'User Name'
+        }
+    ]
+
+
+def test_get_registered_cars_by_emp_name_filters_in_sql(test_register_car_to_emp):
+    db = TestingSessionLocal()
+    db.add(Employees(id=2, name="Other User"))
+    db.add(Cars(make="Ford", model="Focus", color="Blue", number_plate="AB12 CDE", owner_id=2))
+    db.commit()
+
+    with QueryCounter() as queries:
+        response = client.get("/car/register/User Name")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [car['number_plate'] for car in response.json()] == ['ZX10 MNB']
+    assert queries.count == 1
+    statement, parameters = queries.statements[0]
+    assert "employees.name = ?" in statement
+    assert "User Name" in parameters
+    # the name and owner_id indexes narrow the join to the employee's own cars, no table is scanned
+    assert queries.query_plans()[0][:2] == [
+        'SEARCH employees USING COVERING INDEX ix_employees_name (name=?)',
+        'SEARCH cars USING INDEX ix_cars_owner_id (owner_id=?)'
+    ]
+
+
+def test_get_registered_cars_single_query(test_register_car_to_emp):
+    with QueryCounter() as queries:
+        response = client.get("/car/register/")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 1
+    assert queries.count == 1
+
+
+def test_are_cars_registered_to_emp(test_register_car_to_emp):
+    db = TestingSessionLocal()
+    db.add(Cars(make="Ford", model="Focus", color="Blue", number_plate="AB12 CDE"))
+    db.commit()
+
+    request_data = {'number_plates': ['ZX10 MNB', 'AB12 CDE', 'XY99 ZZZ', 'ZX10MN B']}
+
+    with QueryCounter() as queries:
+        response = client.post("/car/is_registered", json=request_data)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {'number_plate': 'ZX10 MNB', 'registered': True, 'allowed': True, 'detail': None},
+        {'number_plate': 'AB12 CDE', 'registered': False, 'allowed': False, 'detail': None},
+        {'number_plate': 'XY99 ZZZ', 'registered': None, 'allowed': False, 'detail': "Car not found."},
+        {'number_plate': 'ZX10MN B', 'registered': None, 'allowed': False, 'detail': "Invalid number plate."}
+    ]
+    # ZX10 MNB is answered by the plate index, the two others share one query
+    assert queries.count == 1
+
+
+def test_are_cars_registered_to_emp_empty_batch():
+    response = client.post("/car/is_registered", json={'number_plates': []})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_add_car_normalizes_number_plate():
+    request_data = {'color': 'Black', 'make': 'Toyota', 'model': 'Prius', 'number_plate': ' as98  ghj'}
+
+    response = client.post("/car", json=request_data)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    db = TestingSessionLocal()
+    model = db.query(Cars).filter(Cars.number_plate == 'AS98 GHJ').first()
+    assert model.plate_key is not None
+    db.query(Cars).delete()
+    db.commit()
+
+
+def test_add_car_invalid_number_plate():
+    request_data = {'color': 'Black', 'make': 'Toyota', 'model': 'Prius', 'number_plate': 'AS98GH J'}
+
+    response = client.post("/car", json=request_data)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_is_car_registered_to_emp_normalizes_number_plate(test_register_car_to_emp):
+    plate_index.clear()
+
+    response = client.get("/car/is_registered/zx10  mnb")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == True
+
+
+def test_add_cars(test_car):
+    request_data = {'cars': [
+        {'color': 'Black', 'make': 'Toyota', 'model': 'Prius', 'number_plate': 'AS98 GHJ'},
+        {'color': 'White', 'make': 'Toyota', 'model': 'Fortuner', 'number_plate': 'zx10 mnb'},
+        {'color': 'Red', 'make': 'Ford', 'model': 'Ka', 'number_plate': 'AS98 GHJ'},
+        {'color': 'Blue', 'make': 'Ford', 'model': 'Focus', 'number_plate': 'AB12 CDE'}
+    ]}
+
+    with QueryCounter() as queries:
+        response = client.post("/car/bulk", json=request_data)
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == [
+        {'number_plate': 'AS98 GHJ', 'id': 2, 'detail': None},
+        {'number_plate': 'ZX10 MNB', 'id': None, 'detail': "Car already exists."},
+        {'number_plate': 'AS98 GHJ', 'id': None, 'detail': "Car already exists."},
+        {'number_plate': 'AB12 CDE', 'id': 3, 'detail': None}
+    ]
+    # plates lookup, one multi-row insert and the write counter of the other workers
+    assert queries.count == 3
+
+    db = TestingSessionLocal()
+    model = db.query(Cars).filter(Cars.id == 3).first()
+    assert model.plate_key is not None
+    assert client.get("/car/is_registered/AB12 CDE").json() == False
+
+
+def test_add_cars_to_employees(test_car, test_emp):
+    db = TestingSessionLocal()
+    db.add(Cars(make="Ford", model="Focus", color="Blue", number_plate="AB12 CDE"))
+    db.commit()
+
+    request_data = {'registrations': [
+        {'number_plate': 'ZX10 MNB', 'owner_id': test_emp.id},
+        {'number_plate': 'XY99 ZZZ', 'owner_id': test_emp.id},
+        {'number_plate': 'AB12 CDE', 'owner_id': 1000}
+    ]}
+
+    with QueryCounter() as queries:
+        response = client.put("/car/register/bulk", json=request_data)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {'number_plate': 'ZX10 MNB', 'owner_id': 1, 'detail': None},
+        {'number_plate': 'XY99 ZZZ', 'owner_id': 1, 'detail': "Car not found."},
+        {'number_plate': 'AB12 CDE', 'owner_id': 1000, 'detail': "Employee not found."}
+    ]
+    # cars lookup, employees lookup, one update, one plate change log insert and the write counter
+    assert queries.count == 5
+
+    db = TestingSessionLocal()
+    assert [car.owner_id for car in db.query(Cars).order_by(Cars.id)] == [1, None]
+    assert client.get("/car/is_registered/ZX10 MNB").json() == True
+
+
+def test_get_all_cars_not_modified(test_car):
+    response = client.get("/car/")
+    etag = response.headers["ETag"]
+
+    # answered without touching the DB while no car changed
+    with QueryCounter() as queries:
+        response = client.get("/car/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert queries.count == 0
+
+    # another page has another tag
+    assert client.get("/car/", params={"limit": 1}).headers["ETag"] != etag
+    assert client.get("/car/", params={"stream": True}).headers["ETag"] != etag
+
+    request_data = {'color': 'Black', 'make': 'Toyota', 'model': 'Prius', 'number_plate': 'AS98 GHJ'}
+    client.post("/car/", json=request_data)
+    response = client.get("/car/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 2
+    assert response.headers["ETag"] != etag
+
+
+def test_get_registered_cars_not_modified(test_register_car_to_emp, test_emp):
+    etag = client.get("/car/register/").headers["ETag"]
+    assert client.get("/car/register/", headers={"If-None-Match": f'W/{etag}'}).status_code == \
+           status.HTTP_304_NOT_MODIFIED
+
+    # employees are part of the registered cars
+    client.post("/emp/", json={'name': 'Another User'})
+    assert client.get("/car/register/", headers={"If-None-Match": etag}).status_code == status.HTTP_200_OK
+
+
+def test_list_endpoints_declare_response_models():
+    schemas = client.get("/openapi.json").json()["components"]["schemas"]
+    assert list(schemas["CarOut"]["properties"]) == ['id', 'make', 'model', 'color', 'number_plate', 'owner_id']
+    assert "name" in schemas["RegisteredCarOut"]["properties"]
+    assert list(schemas["EmployeeOut"]["properties"]) == ['id', 'name']
+
+
+def test_export_registered_cars(test_register_car_to_emp):
+    db = TestingSessionLocal()
+    db.add(Cars(make="Ford", model="Focus", color="Blue", number_plate="AB12 CDE"))
+    db.commit()
+
+    response = client.get("/car/register/export")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == 'attachment; filename="registered_cars.ndjson"'
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {'id': 1, 'make': 'Toyota', 'color': 'White', 'model': 'Fortuner', 'owner_id': 1, 'number_plate': 'ZX10 MNB',
+         'name': 'User Name'}
+    ]
+
+    response = client.get("/car/register/export", params={"format": "csv"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    assert response.text.splitlines() == ['id,make,color,model,owner_id,number_plate,name',
+                                          '1,Toyota,White,Fortuner,1,ZX10 MNB,User Name']
+
+
+def test_export_registered_cars_empty_and_invalid_format():
+    assert client.get("/car/register/export").text == ""
+    assert client.get("/car/register/export", params={"format": "csv"}).text.splitlines() == [
+        'id,make,color,model,owner_id,number_plate,name']
+    assert client.get("/car/register/export", params={"format": "xml"}).status_code == \
+           status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+# statements each endpoint may send, raise a budget only with a reason
+def test_query_budgets(test_register_car_to_emp):
+    with QueryBudget(1):
+        client.get("/car/")
+    with QueryBudget(1):
+        client.get("/car/register/")
+    with QueryBudget(1):
+        client.get("/car/register/User Name")
+    # writes also count themselves in table_writes for the other workers
+    with QueryBudget(2):
+        client.post("/car/", json={'color': 'Blue', 'make': 'Ford', 'model': 'Focus', 'number_plate': 'AB12 CDE'})
+    # the plate index answers
+    with QueryBudget(0):
+        client.get("/car/is_registered/AB12 CDE")
+    with QueryBudget(2):
+        assert client.delete("/car/2").status_code == status.HTTP_204_NO_CONTENT
+    # the delete of a registered car also logs the plate change
+    with QueryBudget(3):
+        assert client.delete("/car/1").status_code == status.HTTP_204_NO_CONTENT
+    with QueryBudget(1):
+        assert client.delete("/car/1").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_query_budget_fails_over_budget(test_car):
+    with pytest.raises(pytest.fail.Exception, match="2 queries over a budget of 1"):
+        with QueryBudget(1):
+            client.get("/car/")
+            client.get("/car/")
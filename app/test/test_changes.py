@@ -0,0 +1,115 @@
+"""
+    Tests the caches of a worker follow the writes made by another worker on the same database
+    -   GET - /car/is_registered/{number_plate}
+    -   GET - /car/ - ETag
+    -   GET - /car/catalog
+    -   GET - /emp/ - ETag
+    -   GET - /occupancy
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import update
+from starlette import status
+
+from .utils import *
+from ..database import get_read_db, get_write_db
+from ..events import WORKER_ID
+from ..models import ParkingEvents, PlateChanges, TableWrites
+from ..plates import number_plate_key
+
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
+
+
+async def load_changes():
+    async with TestingAsyncSessionLocal() as db:
+        await change_follower.load(db)
+
+
+# writes to the DB the way the endpoints of another worker do, bypassing the caches of this one
+def write_on_another_worker(*models, tables=()):
+    db = TestingSessionLocal()
+    db.add_all(models)
+    db.execute(update(TableWrites).filter(TableWrites.name.in_(tables)).values(version=TableWrites.version + 1))
+    db.commit()
+    db.close()
+
+
+def test_registrations_of_another_worker_reach_the_gate(test_car, test_emp):
+    asyncio.run(load_changes())
+    assert client.get("/car/is_registered/ZX10 MNB").json() == False
+
+    db = TestingSessionLocal()
+    db.query(Cars).update({Cars.owner_id: test_emp.id})
+    db.commit()
+    write_on_another_worker(PlateChanges(plate_key=number_plate_key("ZX10 MNB"), registered=True), tables=["cars"])
+    # stale until the next poll
+    assert client.get("/car/is_registered/ZX10 MNB").json() == False
+
+    asyncio.run(poll_changes())
+    assert client.get("/car/is_registered/ZX10 MNB").json() == True
+    assert change_follower.plates == 1
+
+
+def test_writes_of_another_worker_change_etags_and_catalog(test_car, test_emp):
+    asyncio.run(load_changes())
+    cars_etag = client.get("/car/").headers["ETag"]
+    emp_etag = client.get("/emp/").headers["ETag"]
+    assert client.get("/car/catalog").json()[0]["count"] == 1
+
+    write_on_another_worker(Cars(make="Toyota", model="Yaris", color="Red", number_plate="AB12 CDE"),
+                            tables=["cars"])
+    assert client.get("/car/", headers={"If-None-Match": cars_etag}).status_code == status.HTTP_304_NOT_MODIFIED
+
+    asyncio.run(poll_changes())
+    response = client.get("/car/", headers={"If-None-Match": cars_etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 2
+    assert client.get("/car/catalog").json()[0]["count"] == 2
+    # employees were not written
+    assert client.get("/emp/", headers={"If-None-Match": emp_etag}).status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_own_writes_are_counted_for_other_workers(test_car, test_emp):
+    versions = dict(TestingSessionLocal().query(TableWrites.name, TableWrites.version).all())
+
+    client.post("/car/", json={'color': 'Blue', 'make': 'Ford', 'model': 'Focus', 'number_plate': 'AB12 CDE'})
+    client.put("/car/register/AB12 CDE", json={'number_plate': 'AB12 CDE', 'owner_id': test_emp.id})
+    client.post("/emp/", json={'name': 'Another User'})
+
+    db = TestingSessionLocal()
+    assert dict(db.query(TableWrites.name, TableWrites.version).all()) == {
+        'cars': versions['cars'] + 2, 'employees': versions['employees'] + 1}
+    assert [change.registered for change in db.query(PlateChanges)] == [True]
+
+
+# cars let in or out by another worker count against the capacity of this one
+def test_occupancy_follows_the_gates_of_another_worker(test_register_car_to_emp):
+    asyncio.run(load_changes())
+    occupancy.capacity = 1
+    now = datetime.now(timezone.utc)
+
+    def gate_event(number_plate, direction, allowed=True, worker="another"):
+        return ParkingEvents(number_plate=number_plate, plate_key=number_plate_key(number_plate),
+                             direction=direction, timestamp=now, allowed=allowed, worker=worker)
+
+    try:
+        write_on_another_worker(gate_event("AB12 CDE", "entry"), gate_event("CD34 EFG", "entry", allowed=False),
+                                # an event of this worker is already counted by its gate
+                                gate_event("EF56 GHJ", "entry", worker=WORKER_ID))
+        asyncio.run(poll_changes())
+        assert client.get("/occupancy/cars").json() == ['AB12 CDE']
+        response = client.get("/car/is_registered/ZX10 MNB")
+        assert response.json() == False
+        assert response.headers["X-Gate-Detail"] == "Car park is full."
+
+        write_on_another_worker(gate_event("AB12 CDE", "exit"))
+        asyncio.run(poll_changes())
+        assert client.get("/car/is_registered/ZX10 MNB").json() == True
+        assert client.get("/occupancy/cars").json() == ['ZX10 MNB']
+    finally:
+        occupancy.capacity = 0
+        with engine.connect() as connection:
+            connection.execute(text("DELETE FROM parking_events;"))
+            connection.commit()
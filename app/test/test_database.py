@@ -0,0 +1,76 @@
+"""
+    Tests the engine configuration, and the routing of read and write sessions with two SQLite files standing in for
+    a primary and its replica
+"""
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from ..database import async_database_url, create_engines, create_read_engine, get_read_db, get_write_db
+from ..main import app
+from ..schema import create_schema
+
+
+def test_async_database_url():
+    assert str(async_database_url("sqlite:///./parking.db")) == "sqlite+aiosqlite:///./parking.db"
+    assert str(async_database_url("postgresql://user@db/parking")) == "postgresql+asyncpg://user@db/parking"
+
+
+def test_create_engines_sets_sqlite_pragmas(tmp_path):
+    engine, async_engine = create_engines(f"sqlite:///{tmp_path / 'tuned.db'}")
+
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        # NORMAL
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() > 0
+    engine.dispose()
+
+
+def test_reads_and_writes_are_routed(tmp_path):
+    primary, write_engine = create_engines(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica, _ = create_engines(f"sqlite:///{tmp_path / 'replica.db'}")
+    create_schema(primary)
+    create_schema(replica)
+    read_engine = create_read_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    sessions = {get_write_db: async_sessionmaker(write_engine, expire_on_commit=False),
+                get_read_db: async_sessionmaker(read_engine, expire_on_commit=False)}
+
+    def override(dependency):
+        async def get_db():
+            async with sessions[dependency]() as db:
+                yield db
+        return get_db
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            assert (await http.post("/emp/", json={'name': 'Jon Snow'})).status_code == 201
+            # the replica has not caught up
+            assert (await http.get("/emp/")).status_code == 404
+            with replica.begin() as connection:
+                connection.execute(text("INSERT INTO employees (name) VALUES ('Jon Snow')"))
+            assert (await http.get("/emp/")).json() == [{'id': 1, 'name': 'Jon Snow'}]
+
+        # read sessions cannot write
+        async with sessions[get_read_db]() as db:
+            with pytest.raises(OperationalError, match="readonly"):
+                await db.execute(text("INSERT INTO employees (name) VALUES ('Arya Stark')"))
+        await write_engine.dispose()
+        await read_engine.dispose()
+
+    saved = dict(app.dependency_overrides)
+    app.dependency_overrides.update({dependency: override(dependency) for dependency in sessions})
+    try:
+        asyncio.run(run())
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(saved)
+
+    with primary.connect() as connection:
+        assert connection.execute(text("SELECT name FROM employees")).scalars().all() == ['Jon Snow']
+    primary.dispose()
+    replica.dispose()
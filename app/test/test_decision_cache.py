@@ -0,0 +1,113 @@
+"""
+    Tests the gate decision cache and single-flight of gate lookups
+    -   GET - /car/is_registered/{number_plate}
+    -   GET - /car/decision_cache/stats
+"""
+import asyncio
+
+from starlette import status
+
+from .utils import *
+from ..decision_cache import DecisionCache, NOT_FOUND
+from ..gate import lookup_owners
+from ..plate_index import MISSING
+from ..plates import number_plate_key
+from ..database import get_read_db, get_write_db
+
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
+
+
+def test_unknown_plate_is_looked_up_once():
+    with QueryCounter() as queries:
+        for _ in range(5):
+            response = client.get("/car/is_registered/XY99 ZZZ")
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert queries.count == 1
+    assert client.get("/car/decision_cache/stats").json() == {
+        'size': 1, 'hits': 4, 'misses': 1, 'coalesced': 0, 'db_lookups': 1, 'saved': 4}
+
+
+def test_car_writes_invalidate_cached_decisions(test_emp):
+    assert client.get("/car/is_registered/AB12 CDE").status_code == status.HTTP_404_NOT_FOUND
+
+    client.post("/car/", json={'color': 'Blue', 'make': 'Ford', 'model': 'Focus', 'number_plate': 'AB12 CDE'})
+    assert client.get("/car/is_registered/AB12 CDE").json() == False
+
+    client.put("/car/register/AB12 CDE", json={'number_plate': 'AB12 CDE', 'owner_id': test_emp.id})
+    assert client.get("/car/is_registered/AB12 CDE").json() == True
+
+    client.delete("/car/1")
+    assert client.get("/car/is_registered/AB12 CDE").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_concurrent_lookups_share_one_query(test_register_car_to_emp):
+    plate_index.clear()
+    plate_key = number_plate_key('ZX10 MNB')
+
+    async def lookup():
+        async with TestingAsyncSessionLocal() as db:
+            return await lookup_owners(db, [plate_key])
+
+    async def lookups():
+        return await asyncio.gather(*(lookup() for _ in range(5)))
+
+    with QueryCounter() as queries:
+        results = asyncio.run(lookups())
+    assert results == [{plate_key: 1}] * 5
+    assert queries.count == 1
+    assert decision_cache.stats()['coalesced'] == 4
+
+
+# a read waiting on a lookup that is cancelled, its client went away, or fails sends its own lookup
+def test_waiting_lookups_survive_a_cancelled_or_failed_lookup(test_register_car_to_emp):
+    plate_index.clear()
+    plate_key = number_plate_key('ZX10 MNB')
+
+    class StalledDb:
+        async def execute(self, statement):
+            await asyncio.Event().wait()
+
+    class FailingDb:
+        async def execute(self, statement):
+            await asyncio.sleep(0)
+            raise OSError("disk I/O error")
+
+    async def lookups(leader_db, cancel):
+        leader = asyncio.create_task(lookup_owners(leader_db, [plate_key]))
+        await asyncio.sleep(0)
+        async with TestingAsyncSessionLocal() as db:
+            follower = asyncio.create_task(lookup_owners(db, [plate_key]))
+            await asyncio.sleep(0)
+            if cancel:
+                leader.cancel()
+            await asyncio.wait([leader])
+            return await follower, leader.cancelled() or type(leader.exception())
+
+    assert asyncio.run(lookups(StalledDb(), cancel=True)) == ({plate_key: 1}, True)
+    assert decision_cache.stats()['coalesced'] == 1
+    assert decision_cache.stats()['db_lookups'] == 2
+
+    plate_index.clear()
+    decision_cache.clear()
+    assert asyncio.run(lookups(FailingDb(), cancel=False)) == ({plate_key: 1}, OSError)
+
+
+def test_decision_cache_expires_and_evicts():
+    cache = DecisionCache(ttl=60, max_size=2)
+    cache.put({1: NOT_FOUND, 2: 5}, cache.generation)
+    assert cache.get(1) is NOT_FOUND
+    cache.put({3: None}, cache.generation)
+    # 2 was the least recently used
+    assert cache.get(2) is MISSING
+    assert cache.get(3) is None
+
+    # an answer read before a write is not cached
+    generation = cache.generation
+    cache.invalidate(4)
+    cache.put({4: 7}, generation)
+    assert cache.get(4) is MISSING
+
+    expired = DecisionCache(ttl=0, max_size=2)
+    expired.put({1: NOT_FOUND}, expired.generation)
+    assert expired.get(1) is MISSING
@@ -6,9 +6,11 @@
 from starlette import status
 
 from .utils import *
-from ..routers.employee import get_db
+from ..database import get_read_db, get_write_db
+from ..routers.employee import _search_words, _word_prefix_filter
 
-app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
 
 
 def test_add_emp(test_emp):
@@ -35,3 +37,104 @@ def test_get_all_cars_not_found():
     response = client.get("/emp")
     assert response.status_code == status.HTTP_404_NOT_FOUND
     assert response.json() == {'detail': "No employees found."}
+
+
+def test_get_all_employees_paginated(test_emp):
+    client.post("/emp", json={'name': 'Another User'})
+
+    response = client.get("/emp?after_id=1&limit=1")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [{'name': 'Another User', 'id': 2}]
+    assert response.headers['X-Next-After-Id'] == '2'
+
+
+def test_get_all_employees_streamed(test_emp):
+    client.post("/emp/bulk", json={'employees': [{'name': 'Another User'}]})
+
+    response = client.get("/emp?stream=true")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [{'id': 1, 'name': 'User Name'}, {'id': 2, 'name': 'Another User'}]
+
+
+def test_get_all_employees_streamed_empty():
+    response = client.get("/emp?stream=true")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+
+def test_search_employees_by_name_prefix(test_emp):
+    client.post("/emp", json={'name': 'Another User'})
+
+    response = client.get("/emp/search?name=us")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [{'name': 'User Name', 'id': 1}, {'name': 'Another User', 'id': 2}]
+
+    response = client.get("/emp/search?name=ANOTHER u")
+    assert response.json() == [{'name': 'Another User', 'id': 2}]
+
+
+# databases without FTS5 match the same names
+def test_search_employees_fallback_matches_fts(test_emp):
+    client.post("/emp/bulk", json={'employees': [{'name': 'Another User'}, {'name': 'Mary-Jane Watson'},
+                                                 {'name': 'Username Only'}, {'name': 'Dan 100%'},
+                                                 {'name': "Conan O'Brien"}, {'name': 'Anne.Marie Smith'},
+                                                 {'name': 'Jo_Ann Lee'}, {'name': 'Ray O’Neil, Jr'}]})
+    db = TestingSessionLocal()
+    for name in ["us", "ANOTHER u", "jane", "wat mary", "name", "100", "ser", "brien", "o'b", "marie", "anne.m",
+                 "ann", "jo_", "neil", "jr", "rien"]:
+        response = client.get("/emp/search", params={"name": name})
+        fts_ids = [emp['id'] for emp in response.json()] if response.status_code == status.HTTP_200_OK else []
+        words = _search_words(name)
+        fallback_ids = [emp.id for emp in db.query(Employees).filter(_word_prefix_filter(words))
+                        .order_by(Employees.id)]
+        assert fallback_ids == fts_ids, name
+
+
+def test_search_employees_uses_fts_index(test_emp):
+    with QueryCounter() as queries:
+        client.get("/emp/search?name=user")
+
+    assert 'SCAN employees' not in queries.query_plans()[0]
+
+
+def test_search_employees_not_found(test_emp):
+    response = client.get("/emp/search?name=nobody")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {'detail': "No employees found."}
+
+
+def test_add_emps(test_emp):
+    request_data = {'employees': [{'name': 'Jon Snow'}, {'name': 'Arya Stark'}]}
+
+    with QueryCounter() as queries:
+        response = client.post("/emp/bulk", json=request_data)
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == {'ids': [2, 3]}
+    # one multi-row insert and the write counter of the other workers
+    assert queries.count == 2
+
+    db = TestingSessionLocal()
+    assert [emp.name for emp in db.query(Employees).order_by(Employees.id)] == ['User Name', 'Jon Snow', 'Arya Stark']
+    # the new names are searchable
+    assert client.get("/emp/search?name=arya").json() == [{'name': 'Arya Stark', 'id': 3}]
+
+
+def test_add_emps_invalid_name_rejects_batch():
+    request_data = {'employees': [{'name': 'Jon Snow'}, {'name': 'J'}]}
+
+    response = client.post("/emp/bulk", json=request_data)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert client.get("/emp").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_get_all_employees_not_modified(test_emp):
+    etag = client.get("/emp/").headers["ETag"]
+
+    with QueryCounter() as queries:
+        response = client.get("/emp/", headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert queries.count == 0
+
+    client.post("/emp/bulk", json={'employees': [{'name': 'Another User'}]})
+    assert client.get("/emp/", headers={"If-None-Match": etag}).status_code == status.HTTP_200_OK
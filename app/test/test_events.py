@@ -0,0 +1,150 @@
+"""
+    Tests the gate event log
+    -   GET - /car/is_registered/{number_plate}?direction=entry|exit
+    -   WS - /ws/gate
+"""
+import asyncio
+import time
+
+from starlette import status
+
+from .utils import *
+from ..events import EventRecorder
+from ..models import ParkingEvents
+from ..database import get_read_db, get_write_db
+
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
+
+
+@pytest.fixture()
+def parking_events():
+    yield
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM parking_events;"))
+        connection.commit()
+
+
+def stored_events():
+    db = TestingSessionLocal()
+    return [(event.number_plate, event.direction, event.allowed, event.detail)
+            for event in db.query(ParkingEvents).order_by(ParkingEvents.id)]
+
+
+def test_gate_check_records_event(test_register_car_to_emp, parking_events):
+    assert client.get("/car/is_registered/ZX10 MNB").status_code == status.HTTP_200_OK
+    assert client.get("/car/is_registered/ZX10 MNB", params={"direction": "exit"}).status_code == status.HTTP_200_OK
+    assert client.get("/car/is_registered/XY99 ZZZ").status_code == status.HTTP_404_NOT_FOUND
+    assert client.get("/car/is_registered/ZX10 MNB", params={"direction": "sideways"}).status_code == \
+           status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    # nothing is written by the request itself
+    assert stored_events() == []
+    assert event_recorder.stats()["queued"] == 3
+
+    assert asyncio.run(event_recorder.flush(TestingAsyncSessionLocal)) == 3
+    assert stored_events() == [
+        ('ZX10 MNB', 'entry', True, None),
+        ('ZX10 MNB', 'exit', True, None),
+        ('XY99 ZZZ', 'entry', False, "Car not found."),
+    ]
+
+
+def test_gate_websocket_records_event(test_register_car_to_emp, parking_events):
+    with client.websocket_connect("/ws/gate") as websocket:
+        websocket.send_json({'id': 1, 'number_plate': 'ZX10 MNB', 'direction': 'exit'})
+        assert websocket.receive_json()['allow'] == True
+        websocket.send_json({'id': 2, 'number_plate': 'ZX10 MNB', 'direction': 'up'})
+        assert websocket.receive_json() == {'id': 2, 'allow': False, 'detail': "Invalid message."}
+
+    asyncio.run(event_recorder.flush(TestingAsyncSessionLocal))
+    assert stored_events() == [('ZX10 MNB', 'exit', True, None)]
+
+
+def test_recorder_writes_in_batches_and_drains_on_stop(parking_events):
+    recorder = EventRecorder(max_queue=5, batch_size=2, flush_interval=60)
+
+    async def run():
+        recorder.start(TestingAsyncSessionLocal)
+        for i in range(6):
+            recorder.record(f"AB1{i} CDE", None, "entry", False, "Car not found.")
+        # a full batch wakes the writer before the flush interval
+        await asyncio.sleep(0.2)
+        assert recorder.stats()["queued"] < 5
+        await recorder.stop()
+
+    with QueryCounter() as queries:
+        asyncio.run(run())
+
+    assert recorder.stats() == {"queued": 0, "written": 5, "dropped": 1, "failed": 0, "repeated": 0,
+                                "running": False}
+    assert len(stored_events()) == 5
+    # one insert per batch of two
+    assert len([statement for statement, _ in queries.statements if statement.startswith("INSERT")]) == 3
+
+
+def test_recorder_stop_does_not_raise_when_the_db_fails():
+    recorder = EventRecorder(batch_size=2)
+
+    def broken_session():
+        raise OSError("database is gone")
+
+    async def run():
+        recorder.start(broken_session)
+        for i in range(3):
+            recorder.record(f"AB1{i} CDE", None, "entry", False, "Car not found.")
+        await recorder.stop()
+
+    asyncio.run(run())
+    assert recorder.stats() == {"queued": 0, "written": 0, "dropped": 0, "failed": 3, "repeated": 0,
+                                "running": False}
+
+
+def test_repeated_reads_are_logged_once(test_register_car_to_emp, parking_events):
+    for _ in range(5):
+        assert client.get("/car/is_registered/ZX10 MNB").json() == True
+        assert client.get("/car/is_registered/XY99 ZZZ").status_code == status.HTTP_404_NOT_FOUND
+    # another direction or decision is logged, and so is the same read once the window is over
+    client.get("/car/is_registered/ZX10 MNB", params={"direction": "exit"})
+    client.get("/car/is_registered/ZX10 MNB")
+    event_recorder.repeat_window = 0.01
+    try:
+        time.sleep(0.02)
+        client.get("/car/is_registered/ZX10 MNB")
+    finally:
+        event_recorder.repeat_window = EventRecorder().repeat_window
+
+    assert event_recorder.stats()["repeated"] == 8
+    asyncio.run(event_recorder.flush(TestingAsyncSessionLocal))
+    assert stored_events() == [
+        ('ZX10 MNB', 'entry', True, None),
+        ('XY99 ZZZ', 'entry', False, "Car not found."),
+        ('ZX10 MNB', 'exit', True, None),
+        ('ZX10 MNB', 'entry', True, None),
+        ('ZX10 MNB', 'entry', True, None),
+    ]
+
+
+# a batch that fails, the DB is locked by another writer, is written by the next flush
+def test_failed_batch_is_retried(parking_events):
+    recorder = EventRecorder(max_queue=4, batch_size=2)
+    attempts = []
+
+    def locked_once():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("database is locked")
+        return TestingAsyncSessionLocal()
+
+    for i in range(3):
+        recorder.record(f"AB1{i} CDE", None, "entry", False, "Car not found.")
+    with pytest.raises(OSError):
+        asyncio.run(recorder.flush(locked_once))
+    assert recorder.stats()["queued"] == 3
+
+    # events queued meanwhile are written after the retried batch
+    recorder.record("AB13 CDE", None, "entry", False, "Car not found.")
+    assert asyncio.run(recorder.flush(locked_once)) == 4
+    assert [event[0] for event in stored_events()] == ['AB10 CDE', 'AB11 CDE', 'AB12 CDE', 'AB13 CDE']
+    assert recorder.stats() == {"queued": 0, "written": 4, "dropped": 0, "failed": 0, "repeated": 0,
+                                "running": False}
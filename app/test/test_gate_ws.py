@@ -0,0 +1,43 @@
+"""
+    Tests the gate controller WebSocket
+    -   WS - /ws/gate
+"""
+from .utils import *
+from ..database import get_read_db, get_write_db
+
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
+
+
+def test_gate_websocket(test_register_car_to_emp):
+    db = TestingSessionLocal()
+    db.add(Cars(make="Ford", model="Focus", color="Blue", number_plate="AB12 CDE"))
+    db.commit()
+
+    with client.websocket_connect("/ws/gate") as websocket:
+        websocket.send_json({'id': 1, 'number_plate': 'ZX10 MNB'})
+        websocket.send_json({'id': 2, 'number_plate': 'AB12 CDE'})
+        websocket.send_json({'id': 'lane-3', 'number_plate': 'XY99 ZZZ'})
+        websocket.send_json({'id': 4, 'number_plate': 'ZX10MN B'})
+
+        assert websocket.receive_json() == {'id': 1, 'number_plate': 'ZX10 MNB', 'allow': True, 'detail': None}
+        assert websocket.receive_json() == {'id': 2, 'number_plate': 'AB12 CDE', 'allow': False, 'detail': None}
+        assert websocket.receive_json() == {'id': 'lane-3', 'number_plate': 'XY99 ZZZ', 'allow': False,
+                                            'detail': "Car not found."}
+        assert websocket.receive_json() == {'id': 4, 'number_plate': 'ZX10MN B', 'allow': False,
+                                            'detail': "Invalid number plate."}
+
+
+def test_gate_websocket_invalid_message():
+    with client.websocket_connect("/ws/gate") as websocket:
+        websocket.send_text("not json")
+        assert websocket.receive_json() == {'id': None, 'allow': False, 'detail': "Invalid message."}
+        # the id of an invalid JSON object is echoed back
+        websocket.send_json({'id': 7, 'number_plate': 42})
+        assert websocket.receive_json() == {'id': 7, 'allow': False, 'detail': "Invalid message."}
+        websocket.send_json({'id': 'lane-2', 'number_plate': 'ZX10 MNB', 'direction': 'sideways'})
+        assert websocket.receive_json() == {'id': 'lane-2', 'allow': False, 'detail': "Invalid message."}
+        websocket.send_json({'id': 8})
+        assert websocket.receive_json() == {'id': 8, 'allow': False, 'detail': "Invalid message."}
+        websocket.send_json([{'id': 9}])
+        assert websocket.receive_json() == {'id': None, 'allow': False, 'detail': "Invalid message."}
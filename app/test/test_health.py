@@ -1,12 +1,59 @@
 """
     Tests API endpoint for health
     -   GET - /healthy
+    -   GET - /healthy/ready
 """
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
 from fastapi import status
 from .utils import *
+from ..database import get_read_db, get_write_db
+from ..main import warm_up
+
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
 
 
 def test_run_health_check():
     response = client.get("/healthy")
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == {"status": "Healthy"}
+
+
+def test_readiness_check(test_car, test_emp):
+    response = client.get("/healthy/ready")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.json() == {"status": "Starting"}
+
+    asyncio.run(warm_up(TestingAsyncSessionLocal))
+
+    response = client.get("/healthy/ready")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"status": "Ready"}
+    # once warm, registrations no longer look up the employee: the car, the plate change, the update and the
+    # write counter
+    with QueryBudget(4):
+        response = client.put("/car/register/ZX10 MNB", json={'number_plate': 'ZX10 MNB', 'owner_id': test_emp.id})
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+# importing the app does not touch the DB, the lifespan creates the schema and warms up
+def test_schema_is_created_by_the_lifespan(tmp_path):
+    database_path = tmp_path / "startup.db"
+    script = f"""
+import asyncio, os
+os.environ["DATABASE_URL"] = "sqlite:///{database_path}"
+from app.main import app, is_ready
+assert not os.path.exists("{database_path}")
+
+async def start():
+    async with app.router.lifespan_context(app):
+        assert is_ready()
+
+asyncio.run(start())
+assert os.path.exists("{database_path}")
+"""
+    subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).resolve().parents[2], check=True)
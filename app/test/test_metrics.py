@@ -0,0 +1,94 @@
+"""
+    Tests API endpoint for metrics
+    -   GET - /metrics
+    -   Server-Timing header
+"""
+import time
+
+import fastapi.routing
+from starlette import status
+
+from .utils import *
+from sqlalchemy import QueuePool, create_engine
+
+from .. import metrics
+from ..metrics import (Histogram, instrument_engine, timed_pool, http_requests, http_request_sql_statements,
+                       pool_checkout_wait)
+from ..database import get_read_db, get_write_db
+
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
+instrument_engine(async_engine.sync_engine)
+
+
+def test_histogram_expose():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, ("/a",))
+    histogram.observe(0.5, ("/a",))
+    histogram.observe(2.0, ("/a",))
+
+    assert histogram.expose() == [
+        '# HELP latency_seconds Latency.',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1.0"} 2',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 3',
+        'latency_seconds_sum{route="/a"} 2.55',
+        'latency_seconds_count{route="/a"} 3'
+    ]
+
+
+def test_metrics(test_car):
+    http_requests.clear()
+    http_request_sql_statements.clear()
+
+    client.get("/car/is_registered/ZX10 MNB")
+    client.get("/car/is_registered/ZX10 MNB")
+
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith("text/plain")
+    lines = response.text.splitlines()
+    # route templates are used as labels, not the requested paths
+    assert 'http_requests_total{method="GET",route="/car/is_registered/{number_plate}",status="200"} 2' in lines
+    # the first check reads the DB, the second is answered by the plate index
+    assert ('http_request_sql_statements_bucket{method="GET",route="/car/is_registered/{number_plate}",le="0"} 1'
+            in lines)
+    assert ('http_request_sql_statements_count{method="GET",route="/car/is_registered/{number_plate}"} 2'
+            in lines)
+
+
+def test_timed_pool_records_checkout_wait(tmp_path):
+    pool_checkout_wait.clear()
+    timed_engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=timed_pool(QueuePool))
+    with timed_engine.connect():
+        pass
+    timed_engine.dispose()
+
+    assert 'db_pool_checkout_wait_seconds_count 1' in pool_checkout_wait.expose()
+
+
+def test_server_timing(test_car, monkeypatch):
+    assert "server-timing" not in client.get("/car/").headers
+
+    monkeypatch.setattr(metrics, "SERVER_TIMING", True)
+    response = client.get("/car/")
+    db, render, total = response.headers["server-timing"].split(", ")
+    assert db.startswith("db;dur=") and db.endswith(';desc="1 queries"')
+    assert render.startswith("render;dur=")
+    assert total.startswith("total;dur=")
+    assert float(total.split("=")[1]) >= float(render.split("=")[1])
+
+
+# the render entry covers the response model validation, not only the JSON encoding
+def test_server_timing_render_includes_validation(test_car, monkeypatch):
+    serialize_response = fastapi.routing.serialize_response
+
+    async def slow_serialize_response(**kwargs):
+        time.sleep(0.02)
+        return await serialize_response(**kwargs)
+
+    monkeypatch.setattr(metrics, "SERVER_TIMING", True)
+    monkeypatch.setattr(fastapi.routing, "serialize_response", slow_serialize_response)
+    render = client.get("/car/").headers["server-timing"].split(", ")[1]
+    assert float(render.split("=")[1]) >= 20
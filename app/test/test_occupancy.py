@@ -0,0 +1,138 @@
+"""
+    Tests the car park occupancy
+    -   GET - /occupancy - Spaces used and left
+    -   GET - /occupancy/cars - Number plates of the cars inside
+    -   GET - /car/is_registered/{number_plate} - refused entry when the car park is full
+    -   POST - /car/is_registered - not allowed when the car park is full
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from starlette import status
+
+from .utils import *
+from ..models import ParkingEvents
+from ..plates import number_plate_key
+from ..database import get_read_db, get_write_db
+
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
+
+
+@pytest.fixture()
+def capacity():
+    yield
+    occupancy.capacity = 0
+
+
+@pytest.fixture()
+def second_registered_car(test_register_car_to_emp, test_emp):
+    db = TestingSessionLocal()
+    db.add(Cars(make="Ford", model="Focus", color="Blue", number_plate="AB12 CDE", owner_id=test_emp.id))
+    db.commit()
+
+
+def test_occupancy_follows_entries_and_exits(second_registered_car):
+    client.get("/car/is_registered/ZX10 MNB")
+    client.get("/car/is_registered/AB12 CDE")
+    client.get("/car/is_registered/AB12 CDE", params={"direction": "exit"})
+
+    response = client.get("/occupancy")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'capacity': None, 'occupied': 1, 'available': None, 'full': False, 'refused': 0}
+    assert client.get("/occupancy/cars").json() == ['ZX10 MNB']
+
+
+# a car deleted while parked can still leave, and is not rebuilt as inside on restart
+def test_deleted_car_can_exit(test_register_car_to_emp):
+    assert client.get("/car/is_registered/ZX10 MNB").json() == True
+    client.delete("/car/1")
+
+    response = client.get("/car/is_registered/ZX10 MNB", params={"direction": "exit"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == True
+    assert response.headers["X-Gate-Detail"] == "Car not found."
+    assert client.get("/occupancy").json()['occupied'] == 0
+    # an entry of the same plate is still refused
+    assert client.get("/car/is_registered/ZX10 MNB").status_code == status.HTTP_404_NOT_FOUND
+
+    async def rebuild():
+        await event_recorder.flush(TestingAsyncSessionLocal)
+        async with TestingAsyncSessionLocal() as async_db:
+            await occupancy.load(async_db)
+
+    try:
+        asyncio.run(rebuild())
+        assert occupancy.cars_inside() == []
+    finally:
+        with engine.connect() as connection:
+            connection.execute(text("DELETE FROM parking_events;"))
+            connection.commit()
+
+
+def test_gate_refuses_entry_when_full(second_registered_car, capacity):
+    occupancy.capacity = 1
+
+    assert client.get("/car/is_registered/ZX10 MNB").json() == True
+    # no query counts the cars inside
+    with QueryCounter() as queries:
+        response = client.get("/car/is_registered/AB12 CDE")
+    assert not [statement for statement, _ in queries.statements if "count(" in statement.lower()]
+    assert response.json() == False
+    assert response.headers["X-Gate-Detail"] == "Car park is full."
+
+    # a car already inside is let in again, a car leaving frees its space
+    assert client.get("/car/is_registered/ZX10 MNB").json() == True
+    assert client.get("/car/is_registered/ZX10 MNB", params={"direction": "exit"}).json() == True
+    assert client.get("/car/is_registered/AB12 CDE").json() == True
+
+    assert client.get("/occupancy").json() == {'capacity': 1, 'occupied': 1, 'available': 0, 'full': True,
+                                               'refused': 1}
+
+
+def test_batch_gate_check_refuses_entry_when_full(second_registered_car, capacity):
+    occupancy.capacity = 1
+    assert client.get("/car/is_registered/ZX10 MNB").json() == True
+
+    response = client.post("/car/is_registered", json={'number_plates': ['ZX10 MNB', 'AB12 CDE']})
+    assert response.json() == [
+        {'number_plate': 'ZX10 MNB', 'registered': True, 'allowed': True, 'detail': None},
+        {'number_plate': 'AB12 CDE', 'registered': True, 'allowed': False, 'detail': "Car park is full."},
+    ]
+    # the batch check records no entry
+    assert client.get("/occupancy").json() == {'capacity': 1, 'occupied': 1, 'available': 0, 'full': True,
+                                               'refused': 0}
+
+
+def test_gate_websocket_refuses_entry_when_full(second_registered_car, capacity):
+    occupancy.capacity = 1
+
+    with client.websocket_connect("/ws/gate") as websocket:
+        websocket.send_json({'id': 1, 'number_plate': 'ZX10 MNB'})
+        websocket.send_json({'id': 2, 'number_plate': 'AB12 CDE'})
+        assert websocket.receive_json()['allow'] == True
+        assert websocket.receive_json() == {'id': 2, 'number_plate': 'AB12 CDE', 'allow': False,
+                                            'detail': "Car park is full."}
+
+
+def test_occupancy_is_rebuilt_from_events():
+    now = datetime.now(timezone.utc)
+    db = TestingSessionLocal()
+    for number_plate, direction, allowed in [("ZX10 MNB", "entry", True), ("AB12 CDE", "entry", True),
+                                             ("AB12 CDE", "exit", True), ("XY99 ZZZ", "entry", True),
+                                             ("XY99 ZZZ", "exit", False), ("CD34 EFG", "entry", False)]:
+        db.add(ParkingEvents(number_plate=number_plate, plate_key=number_plate_key(number_plate),
+                             direction=direction, timestamp=now, allowed=allowed))
+    db.commit()
+
+    async def load():
+        async with TestingAsyncSessionLocal() as async_db:
+            await occupancy.load(async_db)
+
+    try:
+        asyncio.run(load())
+        assert sorted(occupancy.cars_inside()) == ['XY99 ZZZ', 'ZX10 MNB']
+    finally:
+        with engine.connect() as connection:
+            connection.execute(text("DELETE FROM parking_events;"))
+            connection.commit()
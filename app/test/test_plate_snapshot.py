@@ -0,0 +1,66 @@
+"""
+    Tests the offline plate snapshot
+    -   GET - /car/snapshot - GET the registered plates as a binary snapshot
+    -   GET - /car/snapshot/changes?since= - GET the plates registered or unregistered after a snapshot version
+"""
+from starlette import status
+
+from .utils import *
+from ..plate_snapshot import PlateSnapshot, encode_snapshot, decode_header, MEDIA_TYPE
+from ..plates import number_plate_key
+from ..database import get_read_db, get_write_db
+
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_write_db] = override_get_db
+
+
+def test_encode_and_open_snapshot(tmp_path):
+    plates = ['ZX10 MNB', 'AB12 CDE', 'CD34 EFG']
+    snapshot = encode_snapshot(7, [number_plate_key(number_plate) for number_plate in plates])
+    assert len(snapshot) == 20 + 4 * 3
+    assert decode_header(snapshot) == (7, 3)
+
+    path = tmp_path / "plates.snapshot"
+    path.write_bytes(snapshot)
+    local = PlateSnapshot.open(path)
+    assert local.version == 7
+    assert len(local) == 3
+    assert 'ab12cde' in local and 'ZX10 MNB' in local
+    assert 'XY99 ZZZ' not in local and 'PRIVATE1' not in local
+    assert local.to_bytes() == snapshot
+
+    with pytest.raises(ValueError):
+        PlateSnapshot(b"not a snapshot")
+
+
+def test_snapshot_and_changes(test_register_car_to_emp, test_emp):
+    response = client.get("/car/snapshot")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == MEDIA_TYPE
+    local = PlateSnapshot(response.content)
+    assert response.headers["X-Snapshot-Version"] == str(local.version)
+    assert list(local._keys) == [number_plate_key('ZX10 MNB')]
+    assert 'ZX10 MNB' in local
+
+    # nothing changed since the snapshot
+    assert client.get("/car/snapshot/changes", params={"since": local.version}).json() == {
+        'version': local.version, 'changes': []}
+
+    client.post("/car/", json={'color': 'Blue', 'make': 'Ford', 'model': 'Focus', 'number_plate': 'AB12 CDE'})
+    client.put("/car/register/AB12 CDE", json={'number_plate': 'AB12 CDE', 'owner_id': test_emp.id})
+    assert client.delete("/car/1").status_code == status.HTTP_204_NO_CONTENT
+
+    changes = client.get("/car/snapshot/changes", params={"since": local.version}).json()
+    assert changes == {'version': local.version + 2, 'changes': [
+        {'plate_key': number_plate_key('AB12 CDE'), 'registered': True},
+        {'plate_key': number_plate_key('ZX10 MNB'), 'registered': False},
+    ]}
+    local = local.apply_changes(changes)
+    assert 'AB12 CDE' in local and 'ZX10 MNB' not in local
+    assert local.to_bytes() == client.get("/car/snapshot").content
+
+
+def test_changes_since_unknown_version():
+    response = client.get("/car/snapshot/changes", params={"since": 1000})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {'detail': 'Unknown snapshot version.'}
@@ -0,0 +1,29 @@
+"""
+    Tests the number plate normalizer and its integer encoding
+"""
+import pytest
+
+from ..plates import normalize_number_plate, encode_plate, decode_plate, number_plate_key
+
+
+@pytest.mark.parametrize("number_plate", ["AB01 DEF", "ab01 def", " AB01  DEF ", "AB01DEF", "Ab01\tdEf"])
+def test_normalize_number_plate(number_plate):
+    assert normalize_number_plate(number_plate) == "AB01 DEF"
+
+
+@pytest.mark.parametrize("number_plate", ["ZX10MN B", "AB0 DEFG", "AB01 DE", "A101 DEF", "AB01 DEF GHI", ""])
+def test_normalize_number_plate_invalid(number_plate):
+    assert normalize_number_plate(number_plate) is None
+    assert number_plate_key(number_plate) is None
+
+
+def test_plate_key_round_trip():
+    assert encode_plate("AA00 AAA") == 0
+    assert encode_plate("ZZ99 ZZZ") == 26 * 26 * 100 * 26 * 26 * 26 - 1 < 2 ** 31
+    for number_plate in ["AB01 DEF", "ZX10 MNB", "QW99 ERT"]:
+        assert decode_plate(encode_plate(number_plate)) == number_plate
+
+
+def test_plate_key_preserves_order():
+    number_plates = ["AA00 AAB", "AA01 AAA", "AB00 AAA", "ZX10 MNB"]
+    assert sorted(number_plates, key=encode_plate) == number_plates
@@ -0,0 +1,42 @@
+"""
+    Tests the schema creation and upgrade of existing DB files
+"""
+from sqlalchemy import create_engine
+
+from ..plates import number_plate_key
+from ..schema import SCHEMA_VERSION, create_schema, get_schema_version
+
+
+def test_create_schema_upgrades_existing_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    # DB file created before the secondary indexes existed
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE employees (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR)")
+        connection.exec_driver_sql(
+            "CREATE TABLE cars (id INTEGER NOT NULL PRIMARY KEY, make VARCHAR, model VARCHAR, color VARCHAR, "
+            "number_plate VARCHAR UNIQUE, owner_id INTEGER REFERENCES employees (id))")
+        connection.exec_driver_sql("INSERT INTO employees (name) VALUES ('Jon Snow')")
+        connection.exec_driver_sql(
+            "INSERT INTO cars (make, model, color, number_plate) VALUES ('Ford', 'Focus', 'Blue', 'ab12 cde'), "
+            "('Ford', 'Ka', 'Red', 'AB12 CDE'), ('Škoda', 'Fabia', 'Red', 'PRIVATE1')")
+        # index of the make search before cars.make_key
+        connection.exec_driver_sql("CREATE INDEX ix_cars_make_lower ON cars (lower(make))")
+
+    create_schema(engine)
+
+    with engine.connect() as connection:
+        # read from sqlite_master, the inspector skips expression indexes
+        indexes = set(connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").scalars())
+        assert {'ix_cars_make', 'ix_cars_make_key', 'ix_cars_owner_id', 'ix_cars_plate_key',
+                'ix_employees_name'} <= indexes
+        assert 'ix_cars_make_lower' not in indexes
+        assert get_schema_version(connection) == SCHEMA_VERSION
+        # plate keys are backfilled, the duplicate spelling and the non standard plate keep no key
+        assert connection.exec_driver_sql("SELECT plate_key FROM cars ORDER BY id").scalars().all() == [
+            number_plate_key('AB12 CDE'), None, None]
+        assert connection.exec_driver_sql("SELECT make_key FROM cars ORDER BY id").scalars().all() == [
+            'ford', 'ford', 'škoda']
+        # employees created before the upgrade are searchable
+        assert connection.exec_driver_sql(
+            "SELECT rowid FROM employees_fts WHERE employees_fts MATCH '\"jo\"*'").scalars().all() == [1]
+    engine.dispose()
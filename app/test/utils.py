@@ -1,19 +1,33 @@
 """
     Creates a local DB for testing.
     Configurations for Test DB.
-    override_get_db method to override get_db method and point to test DB.
+    override_get_db method to override get_read_db and get_write_db and point to test DB through an AsyncSession.
     fixtures to create emp and car records to test db.
+    QueryCounter to record the SQL statements an endpoint sends to the test DB.
+    QueryBudget to fail a test when an endpoint sends more statements than it declares.
+    poll_changes to apply the writes of another worker, as the background poll of app/changes.py does.
 """
 import pytest
-from sqlalchemy import create_engine, StaticPool, text
+from sqlalchemy import create_engine, event, StaticPool, NullPool, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from starlette.testclient import TestClient
 
-from ..database import Base
+from ..admission import admission
+from ..catalog import catalog_cache
+from ..changes import change_follower
+from ..decision_cache import decision_cache
+from ..employee_ids import employee_ids
+from ..events import event_recorder
+from ..occupancy import occupancy
 from ..main import app
 from ..models import Cars, Employees
+from ..plate_index import plate_index
+from ..schema import create_schema
+from ..versions import table_versions
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./parking_management_app_test_db.db"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./parking_management_app_test_db.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
@@ -25,21 +39,109 @@ engine = create_engine(
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base.metadata.create_all(bind=engine)
+# the TestClient may run each request on a new event loop, so async connections are not pooled
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
 
+TestingAsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False,
+                                              bind=async_engine)
 
-def override_get_db():
-    db = TestingSessionLocal()
 
-    try:
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 client = TestClient(app)
 
 
+class QueryCounter:
+    """
+        Records every statement executed by the app against the test DB while active.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(async_engine.sync_engine, "before_cursor_execute", self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    # SQLite's plan for each recorded statement, e.g. ["SCAN cars", "SEARCH employees USING ..."]
+    def query_plans(self):
+        plans = []
+        with engine.connect() as connection:
+            for statement, parameters in self.statements:
+                rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+                plans.append([row[-1] for row in rows])
+        return plans
+
+
+class QueryBudget(QueryCounter):
+    """
+        QueryCounter failing the test when more than max_queries statements ran while it was active.
+        with QueryBudget(1):
+            client.delete("/car/1")
+    """
+
+    def __init__(self, max_queries: int):
+        super().__init__()
+        self.max_queries = max_queries
+
+    def __exit__(self, *exc_info):
+        super().__exit__(*exc_info)
+        if exc_info[0] is None and self.count > self.max_queries:
+            statements = "\n".join(statement for statement, _ in self.statements)
+            pytest.fail(f"{self.count} queries over a budget of {self.max_queries}:\n{statements}", pytrace=False)
+
+
+# polls the plate changes and table writes of the other workers once, see app/changes.py
+async def poll_changes():
+    async with TestingAsyncSessionLocal() as db:
+        await change_follower.poll(db)
+
+
+# the test DB is created by the first test, importing the tests does not touch the disk
+@pytest.fixture(scope="session", autouse=True)
+def test_schema():
+    create_schema(engine)
+
+
+# fixtures below write to the DB directly, so no in-process state may outlive a test: the plate index, caches,
+# table versions, admission slots and the change follower's positions, the gate events a test queued and the cars
+# it let in
+@pytest.fixture(autouse=True)
+def reset_process_state():
+    plate_index.clear()
+    event_recorder.clear()
+    occupancy.clear()
+    catalog_cache.clear()
+    table_versions.clear()
+    decision_cache.clear()
+    admission.clear()
+    employee_ids.clear()
+    change_follower.clear()
+    yield
+    plate_index.clear()
+    event_recorder.clear()
+    occupancy.clear()
+    catalog_cache.clear()
+    table_versions.clear()
+    decision_cache.clear()
+    admission.clear()
+    employee_ids.clear()
+    change_follower.clear()
+
+
 @pytest.fixture()
 def test_car():
     car = Cars(
@@ -56,6 +158,7 @@ def test_car():
     yield car
     with engine.connect() as connection:
         connection.execute(text("DELETE FROM cars;"))
+        connection.execute(text("DELETE FROM plate_changes;"))
         connection.commit()
 
 
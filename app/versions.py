@@ -0,0 +1,70 @@
+"""
+    Per-table version counters behind the ETags of the list endpoints.
+    Write endpoints bump the counter of every table they change. A list endpoint derives its ETag from the counters
+    of the tables it reads and the query string, so a poll with a matching If-None-Match gets a 304 before any
+    DB access.
+    Counters live in the process: the ETag also carries a random epoch per process, so a tag from before a restart
+    or from another worker never matches. Write endpoints also count their write in the table_writes table, in the
+    same transaction, and app/changes.py bumps the counters of the tables written by the other workers.
+"""
+import secrets
+from hashlib import blake2b
+
+from fastapi import Request, Response
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from .models import TableWrites
+
+CARS = "cars"
+EMPLOYEES = "employees"
+VERSIONED_TABLES = (CARS, EMPLOYEES)
+
+
+class TableVersions:
+    """
+        Version counter per table, bumped by every write to the table.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(8)
+        self._versions = {}
+
+    def bump(self, *tables):
+        for table in tables:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+    def get(self, table):
+        return self._versions.get(table, 0)
+
+    # strong ETag of a list response built from the given tables
+    def etag(self, request: Request, *tables):
+        versions = ",".join(f"{table}={self.get(table)}" for table in tables)
+        key = f"{self.epoch}:{versions}:{request.url.path}?{request.url.query}"
+        return f'"{blake2b(key.encode(), digest_size=12).hexdigest()}"'
+
+    def clear(self):
+        self.epoch = secrets.token_hex(8)
+        self._versions.clear()
+
+
+table_versions = TableVersions()
+
+
+# counts a write to the tables in table_writes, call it before the commit of the write
+async def record_write(db: AsyncSession, *tables):
+    await db.execute(update(TableWrites).filter(TableWrites.name.in_(tables))
+                     .values(version=TableWrites.version + 1))
+
+
+# 304 response when If-None-Match holds the current ETag, None when the list must be sent
+def not_modified(request: Request, etag: str):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    # weak comparison, as required for If-None-Match
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag in tags or "*" in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return None
@@ -0,0 +1,98 @@
+"""
+    Benchmark of the gate check latency under admin load, with and without admission control.
+    Seeds employees and synthetic cars like bench_api.py, then measures GET /car/is_registered/{number_plate}:
+    -   idle - no other traffic
+    -   admin load, admission off - admin workers loop over full page lists and CSV exports (ADMIN_CONCURRENCY=0)
+    -   admin load, admission on - the same workers, at most --admin-concurrency of their requests run at once
+    Prints a JSON report with the gate p50/p95/p99 latency of each run, and the admin requests served and rejected.
+
+    command: python benchmarks/bench_admission.py --cars 5000 --admin-workers 16 --admin-concurrency 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from bench_api import ROOT, Recorder, current_commit, drive, seed
+from common import synthetic_plates
+
+ADMIN_URLS = ["/car/?limit=1000", "/car/register/export?format=csv", "/emp/?limit=1000", "/car/register/?limit=1000"]
+
+
+async def measure_gate(client, plates, args, admin_workers):
+    recorder = Recorder()
+    admin = {"served": 0, "rejected": 0}
+    stop = asyncio.Event()
+
+    async def gate(i):
+        await recorder.request(client, "gate", "GET", f"/car/is_registered/{plates[i % len(plates)]}")
+
+    async def admin_worker(worker):
+        i = worker
+        while not stop.is_set():
+            response = await client.get(ADMIN_URLS[i % len(ADMIN_URLS)])
+            admin["rejected" if response.status_code == 503 else "served"] += 1
+            if response.status_code == 503:
+                await asyncio.sleep(float(response.headers.get("Retry-After", "1")) / 10)
+            i += 1
+
+    workers = [asyncio.create_task(admin_worker(worker)) for worker in range(admin_workers)]
+    # let the admin load build up before measuring
+    await asyncio.sleep(0.2 if admin_workers else 0)
+    started = time.perf_counter()
+    await drive(gate, args.requests, args.concurrency)
+    recorder.elapsed["gate"] = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*workers)
+    return {"gate": recorder.report()["gate"], "admin": admin if admin_workers else None}
+
+
+async def run(args):
+    # the app reads DATABASE_URL at import, point it to a fresh DB first
+    database_path = Path(tempfile.mkdtemp()) / "bench.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    sys.path.insert(0, str(ROOT))
+    from app.admission import admission
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            plates = synthetic_plates(args.cars)
+            admission.limit = 0
+            await seed(client, args.employees, plates)
+
+            report = {"idle": await measure_gate(client, plates, args, 0)}
+            report["admin load, admission off"] = await measure_gate(client, plates, args, args.admin_workers)
+            admission.limit = args.admin_concurrency
+            report["admin load, admission on"] = await measure_gate(client, plates, args, args.admin_workers)
+            return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=200, help="employees seeded from app/characters.json")
+    parser.add_argument("--cars", type=int, default=5000, help="synthetic cars seeded")
+    parser.add_argument("--requests", type=int, default=2000, help="gate checks per run")
+    parser.add_argument("--concurrency", type=int, default=10, help="gate checks in flight")
+    parser.add_argument("--admin-workers", type=int, default=16, help="admin clients looping over heavy requests")
+    parser.add_argument("--admin-concurrency", type=int, default=2, help="heavy requests admitted at once")
+    args = parser.parse_args()
+
+    runs = asyncio.run(run(args))
+    print(json.dumps({
+        "commit": current_commit(),
+        "config": {"cars": args.cars, "requests": args.requests, "concurrency": args.concurrency,
+                   "admin_workers": args.admin_workers, "admin_concurrency": args.admin_concurrency},
+        "runs": runs,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
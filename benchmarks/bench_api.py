@@ -0,0 +1,193 @@
+"""
+    Benchmark of the HTTP API.
+    Seeds employees from app/characters.json plus synthetic cars, then drives each scenario at a fixed concurrency:
+    -   gate - GET /car/is_registered/{number_plate}, registered, unregistered and unknown plates
+    -   registration - POST /car followed by PUT /car/register/{number_plate}
+    -   list - GET /car, GET /emp and GET /car/register/ (first page)
+    Prints, or writes with --output, a JSON report with throughput and p50/p95/p99 latency per endpoint,
+    tagged with the current commit so runs can be compared across commits.
+
+    In-process run against a fresh temporary SQLite DB (default):
+    command: python benchmarks/bench_api.py --employees 200 --cars 2000 --concurrency 20
+    Run against a server on localhost, seeding through its API:
+    command: python benchmarks/bench_api.py --url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+from common import synthetic_plates, latency_summary
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+# names from app/characters.json, numbered once the file runs out of characters
+def character_names(count):
+    with open(ROOT / "app" / "characters.json") as file:
+        names = [character["characterName"] for character in json.load(file)["characters"]
+                 if character.get("characterName")]
+    return [names[i] if i < len(names) else f"{names[i % len(names)]} {i // len(names)}" for i in range(count)]
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Recorder:
+    """
+        Collects latencies and server errors per endpoint.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.elapsed = {}
+
+    async def request(self, client, endpoint, method, url, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[endpoint].append(time.perf_counter() - started)
+        if response.status_code >= 500:
+            self.errors[endpoint] += 1
+        return response
+
+    def report(self):
+        return {endpoint: latency_summary(latencies, self.elapsed[endpoint], self.errors[endpoint])
+                for endpoint, latencies in self.latencies.items()}
+
+
+# runs operation(i) for i in range(total), with at most `concurrency` operations in flight
+async def drive(operation, total, concurrency):
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            await operation(i)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def seed(client, employees, plates):
+    semaphore = asyncio.Semaphore(20)
+
+    async def send(method, url, **kwargs):
+        async with semaphore:
+            return await client.request(method, url, **kwargs)
+
+    await asyncio.gather(*(send("POST", "/emp/", json={"name": name}) for name in character_names(employees)))
+    owner_ids = []
+    after_id = 0
+    while True:
+        response = await client.get("/emp/", params={"after_id": after_id, "limit": 1000})
+        if response.status_code != 200:
+            break
+        owner_ids += [employee["id"] for employee in response.json()]
+        after_id = owner_ids[-1]
+
+    await asyncio.gather(*(send("POST", "/car/", json={"make": "Bench", "model": "Mark", "color": "Grey",
+                                                       "number_plate": number_plate}) for number_plate in plates))
+    # two cars out of three are registered
+    registered = [(number_plate, owner_ids[i % len(owner_ids)]) for i, number_plate in enumerate(plates) if i % 3]
+    await asyncio.gather(*(send("PUT", f"/car/register/{number_plate}",
+                                json={"number_plate": number_plate, "owner_id": owner_id})
+                           for number_plate, owner_id in registered))
+    return owner_ids
+
+
+async def run_scenarios(client, args):
+    plates = synthetic_plates(args.cars)
+    unknown_plates = synthetic_plates(100, prefix="UN")
+    owner_ids = await seed(client, args.employees, plates)
+    new_plates = synthetic_plates(args.requests, prefix="RG")
+    recorder = Recorder()
+
+    async def gate(i):
+        number_plate = unknown_plates[i % 100] if i % 10 == 0 else plates[i % len(plates)]
+        await recorder.request(client, "GET /car/is_registered/{number_plate}", "GET",
+                               f"/car/is_registered/{number_plate}")
+
+    async def registration(i):
+        number_plate = new_plates[i]
+        await recorder.request(client, "POST /car", "POST", "/car/", json={
+            "make": "Bench", "model": "Mark", "color": "Grey", "number_plate": number_plate})
+        await recorder.request(client, "PUT /car/register/{number_plate}", "PUT", f"/car/register/{number_plate}",
+                               json={"number_plate": number_plate, "owner_id": owner_ids[i % len(owner_ids)]})
+
+    list_urls = [("GET /car", "/car/"), ("GET /emp", "/emp/"), ("GET /car/register/", "/car/register/")]
+
+    async def lists(i):
+        endpoint, url = list_urls[i % 3]
+        await recorder.request(client, endpoint, "GET", url)
+
+    scenarios = {"gate": (gate, ["GET /car/is_registered/{number_plate}"]),
+                 "registration": (registration, ["POST /car", "PUT /car/register/{number_plate}"]),
+                 "list": (lists, ["GET /car", "GET /emp", "GET /car/register/"])}
+    for name in args.scenarios.split(","):
+        operation, endpoints = scenarios[name]
+        started = time.perf_counter()
+        await drive(operation, args.requests, args.concurrency)
+        for endpoint in endpoints:
+            recorder.elapsed[endpoint] = time.perf_counter() - started
+    return recorder.report()
+
+
+async def run_in_process(args):
+    # the app reads DATABASE_URL at import, point it to a fresh DB first
+    database_path = Path(tempfile.mkdtemp()) / "bench.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    sys.path.insert(0, str(ROOT))
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run_scenarios(client, args)
+
+
+async def run_against_server(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        return await run_scenarios(client, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server, the app runs in-process when omitted")
+    parser.add_argument("--employees", type=int, default=200, help="employees seeded from app/characters.json")
+    parser.add_argument("--cars", type=int, default=2000, help="synthetic cars seeded")
+    parser.add_argument("--requests", type=int, default=2000, help="operations per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="operations in flight")
+    parser.add_argument("--scenarios", default="gate,registration,list", help="comma separated scenarios to run")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    endpoints = asyncio.run(run_against_server(args) if args.url else run_in_process(args))
+    report = {
+        "commit": current_commit(),
+        "target": args.url or "in-process",
+        "config": {"employees": args.employees, "cars": args.cars, "requests": args.requests,
+                   "concurrency": args.concurrency},
+        "endpoints": endpoints,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+    Benchmark of the response serialization of the list endpoints, without HTTP or DB time.
+    Loads synthetic cars and employees into an in-memory SQLite DB, then times per 10k rows:
+    -   before - rows rendered the way the handlers did without response models: jsonable_encoder + JSONResponse,
+        for ORM objects and for row mappings
+    -   after - rows validated against the response model (CarOut, RegisteredCarOut, EmployeeOut) and rendered
+        with ORJSONResponse, what FastAPI does for the list endpoints now
+    Prints a JSON report with the best of --repeat runs, in milliseconds per 10k rows.
+
+    command: python benchmarks/bench_serialization.py --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select, insert
+from sqlalchemy.orm import Session
+
+from common import synthetic_plates
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.database import Base  # noqa: E402
+from app.models import Cars, Employees  # noqa: E402
+from app.routers.car import CarOut, RegisteredCarOut, car_columns, registered_cars_query  # noqa: E402
+from app.routers.employee import EmployeeOut  # noqa: E402
+
+
+def seed(session, rows):
+    session.execute(insert(Employees), [{"name": f"Employee {i}"} for i in range(rows)])
+    session.execute(insert(Cars), [{"make": "Bench", "model": "Mark", "color": "Grey", "number_plate": number_plate,
+                                    "owner_id": i + 1} for i, number_plate in enumerate(synthetic_plates(rows))])
+    session.commit()
+
+
+def before(rows):
+    return JSONResponse(jsonable_encoder(rows)).body
+
+
+def after(adapter):
+    def serialize(rows):
+        return ORJSONResponse(adapter.dump_python(adapter.validate_python(rows), mode="json")).body
+    return serialize
+
+
+# best time of the runs, in milliseconds per 10k rows
+def best_time(serialize, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        serialize(rows)
+        timings.append(time.perf_counter() - started)
+    return round(min(timings) * 1000 * 10000 / len(rows), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="rows serialized per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case, the best one is reported")
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        seed(session, args.rows)
+        cases = {
+            "GET /car": (session.scalars(select(Cars)).all(),
+                         session.execute(select(*car_columns)).mappings().all(), TypeAdapter(list[CarOut])),
+            "GET /car/register/": (None, session.execute(registered_cars_query()).mappings().all(),
+                                   TypeAdapter(list[RegisteredCarOut])),
+            "GET /emp": (session.scalars(select(Employees)).all(),
+                         session.execute(select(Employees.id, Employees.name)).mappings().all(),
+                         TypeAdapter(list[EmployeeOut])),
+        }
+
+        report = {}
+        for endpoint, (orm_rows, mapping_rows, adapter) in cases.items():
+            report[endpoint] = {
+                "before_orm_ms": best_time(before, orm_rows, args.repeat) if orm_rows is not None else None,
+                "before_mappings_ms": best_time(before, mapping_rows, args.repeat),
+                "after_ms": best_time(after(adapter), mapping_rows, args.repeat),
+            }
+    print(json.dumps({"rows": args.rows, "unit": "ms per 10k rows", "endpoints": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
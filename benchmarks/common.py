@@ -0,0 +1,39 @@
+"""
+    Helpers shared by the benchmark scripts: synthetic number plates and latency summaries.
+"""
+import statistics
+
+PLATE_LETTERS = "ABCDEFGHJKLMNOPRSTUVWXYZ"
+
+
+# unique standard plates starting with the two letter prefix, up to 100 * 24**3 of them
+def synthetic_plates(count, prefix="BM"):
+    plates = []
+    for i in range(count):
+        letters = i // 100
+        suffix = ""
+        for _ in range(3):
+            letters, letter = divmod(letters, 24)
+            suffix += PLATE_LETTERS[letter]
+        plates.append(f"{prefix}{i % 100:02d} {suffix}")
+    return plates
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+# throughput and latency percentiles of a run, latencies in seconds
+def latency_summary(latencies, elapsed, errors=0):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+    }
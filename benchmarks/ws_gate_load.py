@@ -0,0 +1,70 @@
+"""
+    Load test for the gate controller WebSocket (/ws/gate).
+    Every lane keeps one connection open and sends plate reads back to back, waiting for each reply.
+    Runs once per lane count and prints a JSON report with throughput and round trip latency percentiles.
+
+    Start the server first, then run the load test:
+    command: uvicorn app.main:app
+    command: python benchmarks/ws_gate_load.py --lanes 1,10,50,100,200 --messages 500
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import websockets
+
+from common import synthetic_plates, latency_summary
+
+
+# creates the cars, half of them registered to an employee
+def seed(base_url, plates):
+    with httpx.Client(base_url=base_url) as http:
+        if http.get("/emp/").status_code == 404:
+            http.post("/emp/", json={"name": "Load Test"})
+        owner_id = http.get("/emp/", params={"limit": 1}).json()[0]["id"]
+        for i, number_plate in enumerate(plates):
+            http.post("/car/", json={"make": "Bench", "model": "Mark", "color": "Grey", "number_plate": number_plate})
+            if i % 2 == 0:
+                http.put(f"/car/register/{number_plate}", json={"number_plate": number_plate, "owner_id": owner_id})
+
+
+async def run_lane(ws_url, lane, plates, messages, latencies):
+    async with websockets.connect(ws_url) as websocket:
+        for i in range(messages):
+            started = time.perf_counter()
+            await websocket.send(json.dumps({"id": f"{lane}-{i}", "number_plate": plates[i % len(plates)]}))
+            reply = json.loads(await websocket.recv())
+            latencies.append(time.perf_counter() - started)
+            assert reply["id"] == f"{lane}-{i}"
+
+
+async def run(ws_url, lanes, plates, messages):
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(run_lane(ws_url, lane, plates, messages, latencies) for lane in range(lanes)))
+    elapsed = time.perf_counter() - started
+    return {"lanes": lanes, **latency_summary(latencies, elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="base URL of the running API")
+    parser.add_argument("--lanes", default="1,10,50,100", help="comma separated lane counts to run")
+    parser.add_argument("--messages", type=int, default=500, help="plate reads sent by each lane")
+    parser.add_argument("--plates", type=int, default=200, help="number of seeded cars")
+    parser.add_argument("--no-seed", action="store_true", help="skip seeding the cars")
+    args = parser.parse_args()
+
+    plates = synthetic_plates(args.plates, prefix="WS")
+    if not args.no_seed:
+        seed(args.url, plates)
+
+    ws_url = args.url.replace("http", "ws", 1) + "/ws/gate"
+    report = [asyncio.run(run(ws_url, int(lanes), plates, args.messages)) for lanes in args.lanes.split(",")]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()